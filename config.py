@@ -4,10 +4,13 @@
 ML модели и подключений к API
 """
 
+import os
+
 # === ОСНОВНЫЕ НАСТРОЙКИ ===
 TOP_COINS_COUNT = 250  # Количество топ монет для анализа по маркет капе
 TIMEFRAME = "4h"  # Таймфрейм для анализа (4 часа)
 LOOKBACK_PERIODS = 200  # Количество свечей для загрузки (для расчета индикаторов)
+MIN_OHLCV_BARS = 50  # Минимум свечей истории, чтобы монета попала в анализ
 MAX_SIGNALS_PER_RUN = 5  # Максимум сигналов за один запуск
 DB_NAME = "bot.db"  # Имя файла базы данных SQLite
 
@@ -32,6 +35,21 @@ MIN_ADX = 25  # Минимальное значение ADX для подтве
 SCAN_INTERVAL_HOURS = 4  # Интервал сканирования рынка (каждые 4 часа)
 SIGNAL_CHECK_INTERVAL_MINUTES = 15  # Интервал проверки активных сигналов
 
+# === НАСТРОЙКИ TELEGRAM ===
+TELEGRAM_MAX_CONCURRENT_SENDS = 3  # Одновременных отправок: все идут в один чат (~1 сообщение/с, в группу 20/мин)
+TELEGRAM_MAX_RETRIES = 3  # Повторов отправки после ответа 429 (ожидание retry_after от API)
+TELEGRAM_KEEPALIVE_CONNECTIONS = 10  # Соединений с Bot API, удерживаемых между отправками
+TELEGRAM_REQUEST_TIMEOUT = 10.0  # Таймаут запроса к Bot API, секунды
+
+# === НАСТРОЙКИ КЭШИРОВАНИЯ ===
+TOP_COINS_CACHE_TTL_HOURS = 6  # Время жизни кэша списка топ монет
+TOP_COINS_CACHE_FILE = "top_coins.json"  # Файл кэша топ монет (в каталоге DB_NAME)
+PRICE_CACHE_TTL_SECONDS = 60  # Цена старше этого срока не используется для проверки TP/SL
+OHLCV_CACHE_DIR = "cache"  # Каталог Parquet-снапшотов OHLCV
+MARKETS_CACHE_FILE = os.path.join(OHLCV_CACHE_DIR, "markets.json")  # Кэш load_markets между рестартами
+INDICATOR_CACHE_SIZE = 512  # Записей в LRU-кэшах индикаторов и сводок (символ, последняя свеча)
+OHLCV_SNAPSHOTS_KEEP = 6  # Сколько последних снапшотов хранить (сутки при скане раз в 4ч)
+
 # === НАСТРОЙКИ ЛОГИРОВАНИЯ ===
 LOG_FILE = "bot.log"  # Файл для логов
 LOG_MAX_SIZE = 5 * 1024 * 1024  # 5 MB максимальный размер лог-файла
@@ -39,4 +57,10 @@ LOG_BACKUP_COUNT = 3  # Количество backup файлов логов
 
 # === НАСТРОЙКИ ML ===
 ML_MODEL_PATH = "ml_model.pkl"  # Путь для сохранения обученной модели
+ML_COMPILED_MODEL_PATH = "ml_model.so"  # Скомпилированная через Treelite модель (опционально)
 ML_RETRAIN_DAYS = 7  # Переобучать модель каждые N дней
+ML_N_ESTIMATORS = 100  # Количество деревьев (стоимость предсказания растет линейно)
+ML_MAX_DEPTH = 8  # Максимальная глубина дерева
+ML_MIN_SAMPLES_LEAF = 5  # Минимум примеров в листе
+ML_MAX_FEATURES = "sqrt"  # Признаков на разбиение
+ML_MAX_SAMPLES = 0.7  # Доля выборки для бутстрэпа каждого дерева
@@ -1,15 +1,26 @@
-import ccxt
+import asyncio
+import itertools
+import json
+import os
+import time
+import ccxt.async_support as ccxt
 import pandas as pd
 import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict, Optional
-import time
-from config import TOP_COINS_COUNT, TIMEFRAME, LOOKBACK_PERIODS
+from config import (
+    TOP_COINS_COUNT, TIMEFRAME, LOOKBACK_PERIODS, MIN_OHLCV_BARS, DB_NAME,
+    TOP_COINS_CACHE_TTL_HOURS, TOP_COINS_CACHE_FILE
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+STABLECOINS = frozenset({'USDTUSDT', 'USDCUSDT', 'BUSDUSDT', 'DAIUSDT', 'TUSDUSDT'})
+
 
 class DataFetcher:
     def __init__(self):
@@ -18,9 +29,55 @@ class DataFetcher:
             'options': {'defaultType': 'future'}
         })
         self.coingecko_url = "https://api.coingecko.com/api/v3"
+        # Постоянная HTTP-сессия: keep-alive соединение переиспользуется между сканированиями
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=10,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        )
+        self.session.mount('https://', adapter)
+        self._top_coins_cache: Optional[List[str]] = None
+        self._top_coins_cache_time = 0
+        self._top_coins_cache_limit = 0
+        self._top_coins_ttl = TOP_COINS_CACHE_TTL_HOURS * 3600
+        # Отдельный файл: символы здесь в формате CoinGecko (BTCUSDT)
+        self._top_coins_cache_file = os.path.join(
+            os.path.dirname(DB_NAME), f"marketcap_{TOP_COINS_CACHE_FILE}"
+        )
+        self._load_top_coins_cache()
+
+    def _load_top_coins_cache(self):
+        """Загружает сохраненный на диск список топ монет"""
+        try:
+            with open(self._top_coins_cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._top_coins_cache = cached['symbols']
+            self._top_coins_cache_time = cached['time']
+            self._top_coins_cache_limit = cached['limit']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша топ монет: {e}")
+
+    def _save_top_coins_cache(self):
+        """Сохраняет список топ монет на диск"""
+        try:
+            with open(self._top_coins_cache_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'time': self._top_coins_cache_time,
+                    'limit': self._top_coins_cache_limit,
+                    'symbols': self._top_coins_cache
+                }, f)
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения кэша топ монет: {e}")
+
+    async def get_top_coins_by_marketcap(self, limit: int = TOP_COINS_COUNT) -> List[str]:
+        """Получает топ монет по маркет капе (с кэшем на TOP_COINS_CACHE_TTL_HOURS)"""
+        if (self._top_coins_cache is not None and self._top_coins_cache_limit >= limit
+                and time.time() - self._top_coins_cache_time < self._top_coins_ttl):
+            return self._top_coins_cache[:limit]
 
-    def get_top_coins_by_marketcap(self, limit: int = TOP_COINS_COUNT) -> List[str]:
-        """Получает топ монет по маркет капе"""
         try:
             url = f"{self.coingecko_url}/coins/markets"
             params = {
@@ -30,25 +87,28 @@ class DataFetcher:
                 'page': 1,
                 'sparkline': False
             }
-            response = requests.get(url, params=params, timeout=30)
+            response = await asyncio.to_thread(self.session.get, url, params=params, timeout=30)
             response.raise_for_status()
             data = response.json()
 
-            # Получаем символы
-            symbols = [coin['symbol'].upper() + 'USDT' for coin in data]
-
-            # Фильтруем только те, что есть на Binance Futures
-            available_markets = self.exchange.load_markets()
-            valid_symbols = [s for s in symbols if s in available_markets][:limit]
-
-            # Исключаем стейблкоины
-            stablecoins = ['USDTUSDT', 'USDCUSDT', 'BUSDUSDT', 'DAIUSDT', 'TUSDUSDT']
-            valid_symbols = [s for s in valid_symbols if s not in stablecoins]
+            # Оставляем только монеты с Binance Futures, исключая стейблкоины,
+            # одним ленивым проходом без промежуточных списков
+            available_markets = await self.exchange.load_markets()
+            valid = (
+                s for s in (coin['symbol'].upper() + 'USDT' for coin in data)
+                if s in available_markets and s not in STABLECOINS
+            )
+            valid_symbols = list(itertools.islice(valid, limit))
 
             if not valid_symbols:
                 logger.warning("CoinGecko вернул пустой список, используем fallback")
                 return self._get_fallback_coins()
 
+            self._top_coins_cache = valid_symbols
+            self._top_coins_cache_time = time.time()
+            self._top_coins_cache_limit = limit
+            self._save_top_coins_cache()
+
             logger.info(f"Найдено {len(valid_symbols)} монет для анализа")
             return valid_symbols
 
@@ -65,42 +125,60 @@ class DataFetcher:
             'XLMUSDT', 'APTUSDT', 'NEARUSDT', 'FILUSDT', 'AAVEUSDT'
         ]
 
-    def fetch_ohlcv(self, symbol: str, timeframe: str = TIMEFRAME,
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = TIMEFRAME,
                     limit: int = LOOKBACK_PERIODS) -> Optional[pd.DataFrame]:
         """Получает OHLCV данные для символа"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
-            df['symbol'] = symbol
+            ohlcv = await self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            # Колонки собираются напрямую из ndarray, без построчной сборки DataFrame
+            arr = np.asarray(ohlcv, dtype=np.float64)
+            # float32 достаточно для цен/объёмов и вдвое снижает объём данных для TA/ML
+            values = arr[:, 1:].astype(np.float32)
+            df = pd.DataFrame(
+                {
+                    'open': values[:, 0],
+                    'high': values[:, 1],
+                    'low': values[:, 2],
+                    'close': values[:, 3],
+                    'volume': values[:, 4],
+                },
+                index=pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms')
+            )
+            df.index.name = 'timestamp'
+            df.attrs['symbol'] = symbol  # Скаляр-метаданные вместо колонки из N одинаковых строк
             return df
         except Exception as e:
             logger.warning(f"Ошибка получения данных для {symbol}: {e}")
             return None
 
-    def fetch_all_coins_data(self) -> Dict[str, pd.DataFrame]:
-        """Получает данные для всех топ монет"""
-        symbols = self.get_top_coins_by_marketcap()
+    async def fetch_all_coins_data(self) -> Dict[str, pd.DataFrame]:
+        """Получает данные для всех топ монет конкурентно (темп задаёт rate limiter ccxt)"""
+        symbols = await self.get_top_coins_by_marketcap()
+        results = await asyncio.gather(
+            *(self.fetch_ohlcv(symbol) for symbol in symbols),
+            return_exceptions=True
+        )
         all_data = {}
 
-        for i, symbol in enumerate(symbols):
-            df = self.fetch_ohlcv(symbol)
-            if df is not None and len(df) >= 50:
+        for symbol, df in zip(symbols, results):
+            if isinstance(df, Exception):
+                logger.warning(f"Ошибка получения данных для {symbol}: {df}")
+                continue
+            if df is not None and len(df) >= MIN_OHLCV_BARS:
                 all_data[symbol] = df
 
-            # Rate limiting
-            if (i + 1) % 10 == 0:
-                logger.info(f"Загружено {i + 1}/{len(symbols)} монет")
-                time.sleep(1)
-
         logger.info(f"Успешно загружено данных для {len(all_data)} монет")
         return all_data
 
-    def get_current_price(self, symbol: str) -> float:
+    async def get_current_price(self, symbol: str) -> float:
         """Получает текущую цену"""
         try:
-            ticker = self.exchange.fetch_ticker(symbol)
+            ticker = await self.exchange.fetch_ticker(symbol)
             return ticker['last']
         except:
             return 0.0
+
+    async def close(self):
+        """Закрывает HTTP-сессии ccxt и CoinGecko"""
+        await self.exchange.close()
+        self.session.close()
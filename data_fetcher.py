@@ -4,15 +4,25 @@
 и OHLCV данных
 """
 
-import ccxt
+import asyncio
+import json
+import os
+from pathlib import Path
+import ccxt.async_support as ccxt
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Optional
 import time
 import logging
-from config import TIMEFRAME, LOOKBACK_PERIODS
+from config import (
+    TIMEFRAME, LOOKBACK_PERIODS, MIN_OHLCV_BARS, DB_NAME,
+    TOP_COINS_CACHE_TTL_HOURS, TOP_COINS_CACHE_FILE, MARKETS_CACHE_FILE
+)
 
 logger = logging.getLogger(__name__)
 
+OHLCV_RETRY_ATTEMPTS = 3  # Попыток загрузки OHLCV при превышении rate limit
+
 
 class DataFetcher:
     """
@@ -21,25 +31,97 @@ class DataFetcher:
     """
 
     def __init__(self):
-        """Инициализация подключения к Binance Futures через ccxt"""
+        """Инициализация асинхронного подключения к Binance Futures через ccxt"""
         self.exchange = ccxt.binance({
-            'enableRateLimit': True,  # Автоматический rate limiting
+            'enableRateLimit': True,  # Встроенный throttler ccxt распределяет конкурентные запросы
             'options': {'defaultType': 'future'}  # Используем фьючерсы
         })
         self._markets_cache = None
         self._markets_cache_time = 0
         self._cache_ttl = 3600  # Время жизни кэша - 1 час
+        self._load_markets_from_disk()
+        self._top_coins_cache: Optional[List[str]] = None
+        self._top_coins_cache_time = 0
+        self._top_coins_cache_limit = 0
+        self._top_coins_ttl = TOP_COINS_CACHE_TTL_HOURS * 3600
+        self._top_coins_cache_file = os.path.join(os.path.dirname(DB_NAME), TOP_COINS_CACHE_FILE)
+        self._load_top_coins_cache()
 
-    def _load_markets(self) -> Dict:
+    async def _load_markets(self) -> Dict:
         """Загружает и кэширует список доступных рынков"""
         current_time = time.time()
         if self._markets_cache is None or (current_time - self._markets_cache_time) > self._cache_ttl:
-            self._markets_cache = self.exchange.load_markets()
+            # reload=True: иначе ccxt вернет уже загруженные рынки и кэш не обновится
+            self._markets_cache = await self.exchange.load_markets(reload=self._markets_cache is not None)
             self._markets_cache_time = current_time
+            self._save_markets_to_disk()
             logger.debug("Обновлен кэш рынков Binance Futures")
         return self._markets_cache
 
-    def get_top_coins_by_volume(self, limit: int = 20) -> List[str]:
+    def _load_markets_from_disk(self):
+        """
+        Поднимает кэш рынков с диска, если файл свежее _cache_ttl.
+        Рынки передаются в ccxt через set_markets, поэтому холодный старт обходится без load_markets.
+        """
+        try:
+            mtime = os.path.getmtime(MARKETS_CACHE_FILE)
+            if time.time() - mtime >= self._cache_ttl:
+                return
+            markets = json.loads(Path(MARKETS_CACHE_FILE).read_text(encoding='utf-8'))
+            self._markets_cache = self.exchange.set_markets(markets)
+            self._markets_cache_time = mtime
+            logger.debug("Кэш рынков загружен с диска")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша рынков: {e}")
+
+    def _save_markets_to_disk(self):
+        """Сохраняет кэш рынков на диск"""
+        try:
+            path = Path(MARKETS_CACHE_FILE)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(self._markets_cache, default=str), encoding='utf-8')
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения кэша рынков: {e}")
+
+    def _load_top_coins_cache(self):
+        """Загружает сохраненный на диск список топ монет, чтобы рестарт не вызывал повторный запрос"""
+        try:
+            with open(self._top_coins_cache_file, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._top_coins_cache = cached['symbols']
+            self._top_coins_cache_time = cached['time']
+            self._top_coins_cache_limit = cached['limit']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша топ монет: {e}")
+
+    def _save_top_coins_cache(self):
+        """Сохраняет список топ монет на диск"""
+        try:
+            with open(self._top_coins_cache_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'time': self._top_coins_cache_time,
+                    'limit': self._top_coins_cache_limit,
+                    'symbols': self._top_coins_cache
+                }, f)
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения кэша топ монет: {e}")
+
+    def _has_enough_history(self, market: Dict) -> bool:
+        """
+        Проверяет по дате листинга (info.onboardDate), что по рынку уже накопилось
+        MIN_OHLCV_BARS свечей - иначе OHLCV всё равно будет отброшен после загрузки.
+        """
+        onboard_date = market.get('info', {}).get('onboardDate')
+        if not onboard_date:
+            return True
+        min_age_ms = MIN_OHLCV_BARS * self.exchange.parse_timeframe(TIMEFRAME) * 1000
+        return time.time() * 1000 - int(onboard_date) >= min_age_ms
+
+    async def get_top_coins_by_volume(self, limit: int = 20) -> List[str]:
         """
         Получает топ монет по 24h объёму торгов на Binance Futures.
         
@@ -49,12 +131,17 @@ class DataFetcher:
         Returns:
             Список символов торговых пар (например, ['BTC/USDT:USDT', 'ETH/USDT:USDT', ...])
         """
+        if (self._top_coins_cache is not None and self._top_coins_cache_limit >= limit
+                and time.time() - self._top_coins_cache_time < self._top_coins_ttl):
+            return self._top_coins_cache[:limit]
+
         try:
-            markets = self._load_markets()
+            markets = await self._load_markets()
             usdt_markets = {
                 symbol: markets[symbol]['quoteVolume'] 
                 for symbol in markets 
                 if symbol.endswith('USDT:USDT') and markets[symbol]['active']
+                and self._has_enough_history(markets[symbol])
             }
             # Сортируем по объёму
             sorted_symbols = sorted(usdt_markets, key=lambda x: usdt_markets[x], reverse=True)
@@ -64,6 +151,11 @@ class DataFetcher:
                 logger.warning("Не удалось получить топ монет, используем fallback")
                 return self._get_fallback_coins()
             
+            self._top_coins_cache = top_symbols
+            self._top_coins_cache_time = time.time()
+            self._top_coins_cache_limit = limit
+            self._save_top_coins_cache()
+
             logger.info(f"Найдено {len(top_symbols)} монет для анализа")
             return top_symbols
 
@@ -84,55 +176,136 @@ class DataFetcher:
             'XLM/USDT:USDT', 'APT/USDT:USDT', 'NEAR/USDT:USDT', 'FIL/USDT:USDT', 'AAVE/USDT:USDT'
         ]
 
-    def fetch_ohlcv(self, symbol: str, timeframe: str = TIMEFRAME,
-                    limit: int = LOOKBACK_PERIODS) -> Optional[pd.DataFrame]:
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = TIMEFRAME,
+                    limit: int = LOOKBACK_PERIODS,
+                    since: Optional[int] = None) -> Optional[pd.DataFrame]:
         """
         Получает OHLCV (Open, High, Low, Close, Volume) данные для символа.
+        since (мс) ограничивает выборку свечами начиная с этого времени.
+        При RateLimitExceeded делает ограниченное число повторов с экспоненциальной паузой.
         """
-        try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
-            df = pd.DataFrame(
-                ohlcv,
-                columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']
-            )
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
-            df['symbol'] = symbol
-            return df
-
-        except ccxt.RateLimitExceeded:
-            logger.warning(f"Rate limit для {symbol}, ожидание...")
-            time.sleep(5)
-            return self.fetch_ohlcv(symbol, timeframe, limit)
-        except Exception as e:
-            logger.warning(f"Ошибка получения данных для {symbol}: {e}")
+        for attempt in range(OHLCV_RETRY_ATTEMPTS):
+            try:
+                ohlcv = await self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+                return self._ohlcv_to_dataframe(ohlcv, symbol)
+
+            except ccxt.RateLimitExceeded:
+                if attempt + 1 == OHLCV_RETRY_ATTEMPTS:
+                    break
+                delay = 2 ** attempt
+                logger.warning(f"Rate limit для {symbol}, повтор через {delay}с...")
+                # asyncio.sleep: остальные конкурентные загрузки продолжаются во время паузы
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.warning(f"Ошибка получения данных для {symbol}: {e}")
+                return None
+
+        logger.warning(f"Rate limit для {symbol}: попытки исчерпаны")
+        return None
+
+    @staticmethod
+    def _ohlcv_to_dataframe(ohlcv: List[List[float]], symbol: str) -> pd.DataFrame:
+        """Преобразует ответ ccxt fetch_ohlcv в DataFrame с индексом по времени"""
+        # Колонки собираются напрямую из ndarray, без построчной сборки DataFrame
+        arr = np.asarray(ohlcv, dtype=np.float64)
+        # float32 достаточно для цен/объёмов и вдвое снижает объём данных для TA/ML
+        values = arr[:, 1:].astype(np.float32)
+        df = pd.DataFrame(
+            {
+                'open': values[:, 0],
+                'high': values[:, 1],
+                'low': values[:, 2],
+                'close': values[:, 3],
+                'volume': values[:, 4],
+            },
+            index=pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms')
+        )
+        df.index.name = 'timestamp'
+        df.attrs['symbol'] = symbol  # Скаляр-метаданные вместо колонки из N одинаковых строк
+        return df
+
+    async def _fetch_incremental(self, symbol: str,
+                                 cached: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+        """
+        Догружает только новые свечи поверх ранее загруженного DataFrame.
+        Без кэша или при слишком старом кэше загружает полную историю.
+        """
+        if cached is None or cached.empty:
+            return await self.fetch_ohlcv(symbol)
+
+        last_ts = int(cached.index[-1].timestamp() * 1000)
+        timeframe_ms = self.exchange.parse_timeframe(TIMEFRAME) * 1000
+        if time.time() * 1000 - last_ts >= (LOOKBACK_PERIODS - 1) * timeframe_ms:
+            return await self.fetch_ohlcv(symbol)
+
+        # since=last_ts: последняя (незакрытая) свеча кэша тоже обновится
+        new_df = await self.fetch_ohlcv(symbol, since=last_ts)
+        if new_df is None:
             return None
 
-    def fetch_all_coins_data(self) -> Dict[str, pd.DataFrame]:
+        df = pd.concat([cached, new_df])
+        df = df[~df.index.duplicated(keep='last')].tail(LOOKBACK_PERIODS)
+        df.attrs['symbol'] = symbol
+        return df
+
+    async def fetch_all_coins_data(
+            self, cached: Optional[Dict[str, pd.DataFrame]] = None) -> Dict[str, pd.DataFrame]:
         """
         Получает OHLCV данные для всех топ монет.
+        Запросы выполняются конкурентно, темп задаёт rate limiter ccxt.
+
+        Args:
+            cached: Ранее загруженные данные {символ: DataFrame}; для этих символов
+                запрашиваются только новые свечи
         """
-        symbols = self.get_top_coins_by_volume()
+        cached = cached or {}
+        symbols = await self.get_top_coins_by_volume()
+        results = await asyncio.gather(
+            *(self._fetch_incremental(symbol, cached.get(symbol)) for symbol in symbols),
+            return_exceptions=True
+        )
         all_data = {}
 
-        for i, symbol in enumerate(symbols):
-            df = self.fetch_ohlcv(symbol)
-            if df is not None and len(df) >= 50:
+        for symbol, df in zip(symbols, results):
+            if isinstance(df, Exception):
+                logger.warning(f"Ошибка получения данных для {symbol}: {df}")
+                continue
+            if df is not None and len(df) >= MIN_OHLCV_BARS:
                 all_data[symbol] = df
-            if (i + 1) % 10 == 0:
-                logger.info(f"Загружено {i + 1}/{len(symbols)} монет")
-                time.sleep(1)
 
         logger.info(f"Успешно загружено данных для {len(all_data)} монет")
         return all_data
 
-    def get_current_price(self, symbol: str) -> float:
+    async def get_current_prices(self, symbols: List[str]) -> Dict[str, float]:
         """
-        Получает текущую цену для символа.
+        Получает текущие цены для списка символов одним запросом fetch_tickers.
+
+        Args:
+            symbols: Список торговых пар
+
+        Returns:
+            Словарь {символ: цена}; символы без цены в словарь не попадают
         """
+        if not symbols:
+            return {}
         try:
-            ticker = self.exchange.fetch_ticker(symbol)
-            return float(ticker['last'])
+            tickers = await self.exchange.fetch_tickers(symbols)
+            return {
+                symbol: float(ticker['last'])
+                for symbol, ticker in tickers.items()
+                if ticker.get('last') is not None
+            }
         except Exception as e:
-            logger.warning(f"Ошибка получения цены {symbol}: {e}")
-            return 0.0
+            logger.warning(f"Ошибка получения цен {symbols}: {e}")
+            return {}
+
+    async def get_current_price(self, symbol: str) -> float:
+        """
+        Получает текущую цену для символа.
+        """
+        prices = await self.get_current_prices([symbol])
+        return prices.get(symbol, 0.0)
+
+    async def close(self):
+        """Закрывает HTTP-сессию асинхронного клиента ccxt"""
+        await self.exchange.close()
@@ -4,39 +4,85 @@
 """
 
 import sqlite3
+import threading
+from collections import namedtuple
 from contextlib import contextmanager
 from typing import Optional, Tuple, List, Dict
-from config import DB_NAME
+from config import DB_NAME, POSITION_SIZE_A, POSITION_SIZE_B
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Единое соединение на весь процесс: без повторного открытия файла и с "теплым" кэшем страниц.
+# Создается лениво при первом обращении (get_shared_connection)
+_conn: Optional[sqlite3.Connection] = None
+_conn_lock = threading.Lock()
+_lock = threading.Lock()
+
+# Строка открытой сделки: доступ к полям по атрибуту, порядок - как в SELECT get_open_trades()
+SigRow = namedtuple(
+    'SigRow',
+    'id symbol side entry_a entry_b stop tp1 tp2 tp3 status pnl '
+    'tp1_hit tp2_hit tp3_hit entry_avg opened_at closed_at'
+)
+
+# Открытая сделка для /active: только отображаемые поля, порядок - как в SELECT get_active_trades()
+ActiveRow = namedtuple(
+    'ActiveRow',
+    'symbol side entry_a entry_b stop tp1 tp2 tp3 tp1_hit tp2_hit'
+)
+
+
+def get_shared_connection() -> sqlite3.Connection:
+    """
+    Возвращает общее соединение с БД, создавая его при первом вызове.
+    
+    Returns:
+        Соединение с WAL-журналом и synchronous=NORMAL
+    """
+    global _conn
+    if _conn is None:
+        with _conn_lock:
+            if _conn is None:
+                # isolation_level=None - транзакциями управляем явно через BEGIN/COMMIT в get_connection()
+                conn = sqlite3.connect(DB_NAME, check_same_thread=False, isolation_level=None)
+                conn.row_factory = sqlite3.Row  # Позволяет обращаться к колонкам по имени
+                # WAL: чтения не блокируются записью; synchronous=NORMAL - коммит без fsync журнала
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                _conn = conn
+    return _conn
+
 
 @contextmanager
-def get_connection():
+def get_connection(write: bool = False):
     """
     Контекстный менеджер для безопасной работы с соединением БД.
-    Автоматически закрывает соединение при выходе из контекста.
+    Выдает общее соединение под блокировкой и оборачивает блок в транзакцию.
+    
+    Args:
+        write: Блок пишет в БД - транзакция открывается BEGIN IMMEDIATE,
+            блокировка записи берется сразу, а не при первом UPDATE/INSERT
     """
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # Позволяет обращаться к колонкам по имени
-    try:
-        yield conn
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Ошибка БД: {e}")
-        raise
-    finally:
-        conn.close()
+    conn = get_shared_connection()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception as e:
+            conn.execute("ROLLBACK")
+            logger.error(f"Ошибка БД: {e}")
+            raise
 
 
 def init_db():
     """
-    Инициализирует базу данных, создает необходимые таблицы.
-    Добавлены поля tp1_hit, tp2_hit для отслеживания достигнутых TP уровней.
+    Инициализирует базу данных, создает необходимые таблицы и индексы.
+    Добавлены поля tp1_hit, tp2_hit для отслеживания достигнутых TP уровней
+    и entry_avg - средневзвешенная цена входа, рассчитываемая один раз при открытии.
     """
-    with get_connection() as conn:
+    with get_connection(write=True) as conn:
         conn.execute("""
         CREATE TABLE IF NOT EXISTS trades (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -53,13 +99,53 @@ def init_db():
             tp1_hit INTEGER DEFAULT 0,
             tp2_hit INTEGER DEFAULT 0,
             tp3_hit INTEGER DEFAULT 0,
+            entry_avg REAL,
             opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             closed_at TIMESTAMP
         )
         """)
+        # Миграция БД, созданных до появления entry_avg: колонка + заполнение по формуле весов
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(trades)")}
+        if 'entry_avg' not in columns:
+            conn.execute("ALTER TABLE trades ADD COLUMN entry_avg REAL")
+            conn.execute(
+                """UPDATE trades SET entry_avg = CASE 
+                       WHEN entry_b IS NULL THEN entry_a 
+                       ELSE entry_a * ? + entry_b * ? END""",
+                (POSITION_SIZE_A, POSITION_SIZE_B)
+            )
+            logger.info("Добавлена колонка entry_avg в таблицу trades")
+        # Частичный индекс только по открытым сделкам - горячий запрос get_open_trades()
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status) WHERE status = 'OPEN'"
+        )
+        # Индекс для агрегаций статистики по закрытым сделкам
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trades_closed ON trades(status, closed_at)"
+        )
+        # Индекс для группировки лучших монет по закрытым сделкам
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_trades_symbol ON trades(status, symbol)"
+        )
         logger.info("База данных инициализирована")
 
 
+def calc_entry_avg(entry_a: float, entry_b: Optional[float]) -> float:
+    """
+    Рассчитывает средневзвешенную цену входа с учетом пропорций позиций.
+    
+    Args:
+        entry_a: Основная точка входа
+        entry_b: Точка усреднения (может быть None)
+        
+    Returns:
+        Средневзвешенная цена входа
+    """
+    if entry_b is None:
+        return entry_a
+    return entry_a * POSITION_SIZE_A + entry_b * POSITION_SIZE_B
+
+
 def open_trade(symbol: str, side: str, entry_a: float, entry_b: Optional[float],
                stop: float, tp1: float, tp2: float, tp3: float) -> int:
     """
@@ -76,18 +162,46 @@ def open_trade(symbol: str, side: str, entry_a: float, entry_b: Optional[float],
     Returns:
         ID созданной записи
     """
-    with get_connection() as conn:
+    with get_connection(write=True) as conn:
         cursor = conn.execute(
             """INSERT INTO trades 
-               (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3, status) 
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'OPEN')""",
-            (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3)
+               (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3, entry_avg, status) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'OPEN')""",
+            (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3,
+             calc_entry_avg(entry_a, entry_b))
         )
         trade_id = cursor.lastrowid
         logger.info(f"Открыта сделка #{trade_id}: {symbol} {side}")
         return trade_id
 
 
+def open_trades_batch(rows: List[Tuple]) -> List[int]:
+    """
+    Открывает несколько сделок одной транзакцией (executemany).
+    
+    Args:
+        rows: Кортежи (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3)
+        
+    Returns:
+        Список ID созданных записей в порядке rows
+    """
+    if not rows:
+        return []
+    
+    with get_connection(write=True) as conn:
+        conn.executemany(
+            """INSERT INTO trades 
+               (symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3, entry_avg, status) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'OPEN')""",
+            (row + (calc_entry_avg(row[2], row[3]),) for row in rows)
+        )
+        # executemany не обновляет lastrowid, но внутри одной транзакции ID идут подряд
+        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        trade_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+        logger.info(f"Открыто сделок: {len(trade_ids)} (#{trade_ids[0]}-#{trade_ids[-1]})")
+        return trade_ids
+
+
 def close_trade(trade_id: int, pnl: float):
     """
     Закрывает сделку с указанным PnL.
@@ -96,7 +210,7 @@ def close_trade(trade_id: int, pnl: float):
         trade_id: ID сделки
         pnl: Процент прибыли/убытка
     """
-    with get_connection() as conn:
+    with get_connection(write=True) as conn:
         conn.execute(
             """UPDATE trades 
                SET status='CLOSED', pnl=?, closed_at=CURRENT_TIMESTAMP 
@@ -119,7 +233,7 @@ def mark_tp_hit(trade_id: int, tp_level: int):
         return
     
     column = f"tp{tp_level}_hit"
-    with get_connection() as conn:
+    with get_connection(write=True) as conn:
         conn.execute(
             f"UPDATE trades SET {column} = 1 WHERE id = ?",
             (trade_id,)
@@ -127,17 +241,60 @@ def mark_tp_hit(trade_id: int, tp_level: int):
         logger.info(f"Сделка #{trade_id}: TP{tp_level} достигнут")
 
 
-def get_open_trades() -> List[Dict]:
+def update_trades_batch(updates: List[Dict]):
     """
-    Получает все открытые сделки.
+    Применяет результаты проверки сигналов одной транзакцией (executemany).
+    
+    Args:
+        updates: Словари с ключами id, tp1_hit, tp2_hit, tp3_hit и pnl;
+            pnl не None означает закрытие сделки
+    """
+    if not updates:
+        return
+    
+    with get_connection(write=True) as conn:
+        conn.executemany(
+            """UPDATE trades 
+               SET tp1_hit = :tp1_hit, tp2_hit = :tp2_hit, tp3_hit = :tp3_hit,
+                   status = CASE WHEN :pnl IS NULL THEN status ELSE 'CLOSED' END,
+                   pnl = COALESCE(:pnl, pnl),
+                   closed_at = CASE WHEN :pnl IS NULL THEN closed_at ELSE CURRENT_TIMESTAMP END
+               WHERE id = :id""",
+            updates
+        )
+        logger.info(f"Обновлено сделок: {len(updates)}")
+
+
+def get_open_trades() -> List[SigRow]:
+    """
+    Получает все открытые сделки вместе с флагами TP и средней ценой входа.
     
     Returns:
-        Список словарей с данными сделок
+        Список SigRow с данными сделок
     """
     with get_connection() as conn:
-        cursor = conn.execute("SELECT * FROM trades WHERE status = 'OPEN'")
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        cursor = conn.execute(
+            """SELECT id, symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3, 
+                      status, pnl, tp1_hit, tp2_hit, tp3_hit, entry_avg, opened_at, closed_at 
+               FROM trades WHERE status = 'OPEN'"""
+        )
+        return [SigRow._make(row) for row in cursor.fetchall()]
+
+
+def get_active_trades() -> List[ActiveRow]:
+    """
+    Получает открытые сделки для отображения: выбираются только нужные колонки,
+    строки отбираются по индексу status, без полного сканирования таблицы.
+    
+    Returns:
+        Список ActiveRow
+    """
+    with get_connection() as conn:
+        cursor = conn.execute(
+            """SELECT symbol, side, entry_a, entry_b, stop, tp1, tp2, tp3, tp1_hit, tp2_hit
+               FROM trades WHERE status = 'OPEN'"""
+        )
+        return [ActiveRow._make(row) for row in cursor.fetchall()]
 
 
 def is_tp_hit(trade_id: int, tp_level: int) -> bool:
@@ -164,24 +321,99 @@ def is_tp_hit(trade_id: int, tp_level: int) -> bool:
         return bool(row[0]) if row else False
 
 
-def stats() -> Tuple[int, int, float]:
+# Фильтр периода: закрытые сделки - по дате закрытия, открытые - по дате открытия.
+# :days = NULL - за все время
+_PERIOD_FILTER = """
+    :days IS NULL 
+    OR COALESCE(closed_at, opened_at) >= datetime('now', '-' || :days || ' days')
+"""
+
+
+def get_full_stats(days: Optional[int] = None) -> Dict:
     """
-    Получает базовую статистику по закрытым сделкам.
+    Получает статистику сделок одним запросом: агрегаты и производные метрики
+    (winrate, средний PnL, profit factor) считаются в SQL.
+    
+    Args:
+        days: Период в днях; None - за все время
     
     Returns:
-        Кортеж (всего сделок, выигрышных, общий PnL)
+        Словарь: total, wins, losses, winrate, total_pnl, avg_pnl, loss_rate,
+        avg_win, profit_factor (по закрытым сделкам) и tp1_hits, tp2_hits, tp3_hits
     """
     with get_connection() as conn:
-        cursor = conn.execute("""
+        cursor = conn.execute(f"""
+            WITH period AS (
+                SELECT status, pnl, tp1_hit, tp2_hit, tp3_hit
+                FROM trades
+                WHERE {_PERIOD_FILTER}
+            ),
+            agg AS (
+                SELECT 
+                    COALESCE(SUM(status = 'CLOSED'), 0) AS total,
+                    COALESCE(SUM(status = 'CLOSED' AND pnl > 0), 0) AS wins,
+                    COALESCE(SUM(CASE WHEN status = 'CLOSED' THEN pnl END), 0.0) AS total_pnl,
+                    COALESCE(SUM(tp1_hit), 0) AS tp1_hits,
+                    COALESCE(SUM(tp2_hit), 0) AS tp2_hits,
+                    COALESCE(SUM(tp3_hit), 0) AS tp3_hits
+                FROM period
+            )
             SELECT 
-                COUNT(*),
-                SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END),
-                SUM(pnl)
+                total,
+                wins,
+                total - wins AS losses,
+                CASE WHEN total > 0 THEN wins * 100.0 / total ELSE 0.0 END AS winrate,
+                total_pnl,
+                CASE WHEN total > 0 THEN total_pnl / total ELSE 0.0 END AS avg_pnl,
+                CASE WHEN total > 0 THEN 100 - wins * 100.0 / total ELSE 0.0 END AS loss_rate,
+                -- Средний выигрыш (только для прибыльных сделок)
+                CASE WHEN wins > 0 AND total_pnl > 0 THEN total_pnl / wins ELSE 0.0 END AS avg_win,
+                -- Profit Factor (упрощенный)
+                CASE WHEN total > 0 THEN ABS(total_pnl / total) ELSE 0.0 END AS profit_factor,
+                tp1_hits,
+                tp2_hits,
+                tp3_hits
+            FROM agg
+        """, {'days': days})
+        return dict(cursor.fetchone())
+
+
+def get_best_performers(limit: int = 5, days: Optional[int] = None) -> List[Dict]:
+    """
+    Получает список лучших монет по суммарному PnL закрытых сделок.
+    
+    Args:
+        limit: Максимальное количество монет в списке
+        days: Период в днях; None - за все время
+        
+    Returns:
+        Список словарей: symbol, total, wins, losses, pnl
+    """
+    with get_connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT symbol, 
+                   COUNT(*) AS total,
+                   SUM(pnl > 0) AS wins,
+                   SUM(pnl < 0) AS losses,
+                   COALESCE(SUM(pnl), 0.0) AS pnl
             FROM trades
-            WHERE status = 'CLOSED'
-        """)
-        total, wins, pnl = cursor.fetchone()
-        return total or 0, wins or 0, pnl or 0.0
+            WHERE status = 'CLOSED' AND ({_PERIOD_FILTER})
+            GROUP BY symbol
+            ORDER BY pnl DESC
+            LIMIT :limit
+        """, {'days': days, 'limit': limit})
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def stats() -> Tuple[int, int, float]:
+    """
+    Получает базовую статистику по закрытым сделкам.
+    
+    Returns:
+        Кортеж (всего сделок, выигрышных, общий PnL)
+    """
+    full = get_full_stats()
+    return full['total'], full['wins'], full['total_pnl']
 
 
 def get_tp_stats() -> Dict[str, int]:
@@ -191,17 +423,9 @@ def get_tp_stats() -> Dict[str, int]:
     Returns:
         Словарь с количеством достигнутых TP1, TP2, TP3
     """
-    with get_connection() as conn:
-        cursor = conn.execute("""
-            SELECT 
-                SUM(tp1_hit) as tp1_count,
-                SUM(tp2_hit) as tp2_count,
-                SUM(tp3_hit) as tp3_count
-            FROM trades
-        """)
-        row = cursor.fetchone()
-        return {
-            'tp1_hits': row[0] or 0,
-            'tp2_hits': row[1] or 0,
-            'tp3_hits': row[2] or 0
-        }
+    full = get_full_stats()
+    return {
+        'tp1_hits': full['tp1_hits'],
+        'tp2_hits': full['tp2_hits'],
+        'tp3_hits': full['tp3_hits']
+    }
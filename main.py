@@ -8,19 +8,38 @@ import os
 import sys
 import asyncio
 import logging
+import glob
+import multiprocessing
+import uvloop
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
 from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
+try:
+    from numba import config as numba_config
+    # Слой потоков Numba для параллельной проверки сигналов. Задается до импорта модулей бота:
+    # ядро signal_tracker_numba компилируется (и запускает потоки) при импорте. workqueue
+    # переживает fork пула процессов Engine, TBB после fork зависает при выходе интерпретатора
+    numba_config.THREADING_LAYER = 'workqueue'
+except ImportError:
+    pass
+
 from data_fetcher import DataFetcher
-from signal_generator import SignalGenerator
+from signal_generator import OHLCV_COLUMNS, SignalGenerator, process_symbol
 from telegram_bot import TelegramBot
 from telegram_commands import setup
 import database as db
 from config import (
     MAX_SIGNALS_PER_RUN, SCAN_INTERVAL_HOURS, SIGNAL_CHECK_INTERVAL_MINUTES,
-    LOG_FILE, LOG_MAX_SIZE, LOG_BACKUP_COUNT, POSITION_SIZE_A, POSITION_SIZE_B
+    LOG_FILE, LOG_MAX_SIZE, LOG_BACKUP_COUNT, POSITION_SIZE_A, POSITION_SIZE_B,
+    OHLCV_CACHE_DIR, OHLCV_SNAPSHOTS_KEEP
 )
 from signal_tracker import SignalTracker
 from statistics import StatisticsManager
@@ -28,6 +47,11 @@ from technical_analysis import TechnicalAnalyzer
 from ml_predictor import MLPredictor
 
 
+# Event loop на libuv - быстрее стандартного для сетевой нагрузки (ccxt, Telegram).
+# Ставится до создания любого loop, APScheduler и python-telegram-bot подхватывают политику
+uvloop.install()
+
+
 def setup_logging():
     """
     Настраивает систему логирования.
@@ -93,12 +117,25 @@ class Engine:
     
     def __init__(self):
         """Инициализация всех компонентов"""
+        # Пул процессов для расчета индикаторов: pandas/ta-часть держит GIL, символы независимы.
+        # Воркеры форкаются сразу, до пулов потоков, event loop и соединений
+        self._process_pool = self._create_process_pool()
+        
         self.data_fetcher = DataFetcher()
         self.ta = TechnicalAnalyzer()
         self.ml = MLPredictor()
         self.signal_gen = SignalGenerator(self.ta, self.ml)
         self.tracker = SignalTracker(self.data_fetcher, bot)
         self.stats_manager = StatisticsManager()
+        # Пул для расчета индикаторов и ML по символам: numpy/sklearn отпускают GIL
+        self._executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        # OHLCV прошлого сканирования (при старте - из Parquet-снапшота): догружаются только новые свечи
+        self._ohlcv_cache: Dict[str, pd.DataFrame] = self._load_ohlcv_snapshot()
+        # Сканирования выполняются строго по одному: /force во время планового скана ждет его
+        # окончания, иначе оба продвигали бы одни и те же состояния онлайн-индикаторов
+        self._run_lock = asyncio.Lock()
+        # Фоновая запись Parquet-снапшота: дожидается перед следующей записью и в close()
+        self._persist_future: Optional[asyncio.Future] = None
         
         logger.info("Engine инициализирован")
     
@@ -106,33 +143,90 @@ class Engine:
         """
         Основной цикл сканирования рынка.
         """
+        if self._run_lock.locked():
+            logger.info("Сканирование уже выполняется, ожидаю его завершения")
+        async with self._run_lock:
+            await self._run()
+    
+    async def _run(self):
+        """Одно сканирование рынка (вызывается под _run_lock)"""
         logger.info("Запуск сканирования рынка...")
         
         sent = 0
         
         try:
-            all_data = await asyncio.get_event_loop().run_in_executor(
-                None, self.data_fetcher.fetch_all_coins_data
+            all_data = await self.data_fetcher.fetch_all_coins_data(self._ohlcv_cache)
+            self._ohlcv_cache = all_data
+            
+            loop = asyncio.get_running_loop()
+            # Снапшоты пишутся по одному: ротация OHLCV_SNAPSHOTS_KEEP не должна пересекаться
+            await self._wait_persist()
+            self._persist_future = loop.run_in_executor(self._executor, self._persist_ohlcv, all_data)
+            if not self.ml.trained:
+                await loop.run_in_executor(self._executor, self._train_ml, all_data)
+            
+            # Символы с неизменной последней свечой берутся из кэша сводок,
+            # с сохраненным состоянием индикаторов - досчитываются онлайн по новым свечам
+            summaries = await loop.run_in_executor(self._executor, self._update_online, all_data)
+            
+            # Остальные считаются полностью в процессах; в воркеры уходят только массивы
+            # времени и OHLCV, обратно - сводки последней свечи и состояния индикаторов
+            items = [
+                (symbol, df.index.to_numpy(), df[OHLCV_COLUMNS].to_numpy())
+                for symbol, df in all_data.items() if symbol not in summaries
+            ]
+            try:
+                # Задачи отправляются из потока event loop, ожидание результатов - в пуле потоков
+                results = self._process_pool.map(
+                    process_symbol, items, chunksize=self._scan_chunksize(len(items))
+                )
+                results = await loop.run_in_executor(self._executor, list, results)
+            except BrokenProcessPool as e:
+                # Воркер погиб (OOM, сбой нативного кода): это сканирование досчитывается
+                # в пуле потоков, пул процессов пересоздается после него
+                logger.error(f"Пул процессов сломан, расчет в пуле потоков: {e}")
+                results = await asyncio.gather(*(
+                    loop.run_in_executor(self._executor, process_symbol, item) for item in items
+                ))
+                await self._restart_process_pool()
+            for (symbol, _, _), result in zip(items, results):
+                if result is not None:
+                    summaries[symbol], state = result
+                    self.signal_gen.store_state(symbol, state)
+                    self.signal_gen.cache_summary(all_data[symbol], symbol, summaries[symbol])
+            
+            # Порядок символов - как в all_data (по объему), от него зависит лимит сигналов
+            summaries = {symbol: summaries[symbol] for symbol in all_data if symbol in summaries}
+            
+            # Одно обращение к модели на всё сканирование вместо predict_proba на каждый символ
+            ml_preds = self.ml.predict_rows(
+                {symbol: summary['features'] for symbol, summary in summaries.items()}
             )
             
-            for symbol, df in all_data.items():
-                sig = self.signal_gen.generate(df, symbol)
-                
-                if sig:
-                    db.open_trade(
-                        sig.symbol, sig.side, sig.entry_a, sig.entry_b,
-                        sig.stop, sig.tp1, sig.tp2, sig.tp3
-                    )
-                    
-                    message = self._format_signal_message(sig)
-                    await bot.send(message)
-                    sent += 1
-                    
-                    logger.info(f"Отправлен сигнал #{sent}: {sig.symbol} {sig.side}")
-                
-                if sent >= MAX_SIGNALS_PER_RUN:
-                    logger.info(f"Достигнут лимит сигналов: {MAX_SIGNALS_PER_RUN}")
-                    break
+            generated = [
+                self.signal_gen.evaluate_summary(summary, symbol, ml_preds[symbol])
+                for symbol, summary in summaries.items()
+            ]
+            signals = [sig for sig in generated if sig]
+            if len(signals) > MAX_SIGNALS_PER_RUN:
+                logger.info(f"Достигнут лимит сигналов: {MAX_SIGNALS_PER_RUN}")
+                signals = signals[:MAX_SIGNALS_PER_RUN]
+            
+            # Все сигналы сканирования записываются в БД одной транзакцией
+            db.open_trades_batch([
+                (sig.symbol, sig.side, sig.entry_a, sig.entry_b,
+                 sig.stop, sig.tp1, sig.tp2, sig.tp3)
+                for sig in signals
+            ])
+            
+            # Сообщения сканирования отправляются одной конкурентной пачкой
+            delivered = await bot.send_many([self._format_signal_message(sig) for sig in signals])
+            for sig, ok in zip(signals, delivered):
+                if not ok:
+                    logger.warning(f"Сигнал не доставлен: {sig.symbol} {sig.side}")
+                    continue
+                sent += 1
+                logger.info(f"Отправлен сигнал #{sent}: {sig.symbol} {sig.side}")
             
             logger.info(f"Сканирование завершено. Отправлено сигналов: {sent}")
             
@@ -150,14 +244,119 @@ class Engine:
         except Exception as e:
             logger.error(f"Ошибка проверки сигналов: {e}")
     
+    def _update_online(self, all_data: Dict[str, pd.DataFrame]) -> Dict[str, Dict]:
+        """Сводки символов из кэша или по состоянию онлайн-индикаторов"""
+        self.signal_gen.retain_states(all_data)
+        summaries = {}
+        for symbol, df in all_data.items():
+            summary = self.signal_gen.update_online(df, symbol)
+            if summary is not None:
+                summaries[symbol] = summary
+        return summaries
+    
+    @staticmethod
+    def _create_process_pool() -> ProcessPoolExecutor:
+        """
+        Создает пул процессов и сразу форкает все воркеры: первая задача запускает их все,
+        а в fork-контексте новые воркеры позже не создаются.
+        fork: модуль main создает бота и Engine при импорте, spawn выполнил бы это в каждом воркере.
+        """
+        pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('fork')
+        )
+        pool.submit(int).result()
+        return pool
+    
+    async def _restart_process_pool(self):
+        """Заменяет сломанный пул процессов новым, когда пул потоков простаивает"""
+        self._process_pool.shutdown(wait=False, cancel_futures=True)
+        # Форк - без фоновых задач в других потоках: дожидаемся записи снапшота
+        await self._wait_persist()
+        try:
+            self._process_pool = self._create_process_pool()
+            logger.info("Пул процессов пересоздан")
+        except Exception as e:
+            logger.error(f"Ошибка пересоздания пула процессов: {e}")
+    
+    def _scan_chunksize(self, n_items: int) -> int:
+        """
+        Размер пачки символов на одну задачу пула процессов:
+        ~4 пачки на воркер - меньше IPC, но нагрузка остается равномерной.
+        """
+        return max(1, n_items // ((os.cpu_count() or 1) * 4))
+    
+    def _train_ml(self, all_data: Dict[str, pd.DataFrame]):
+        """Обучает ML модель на первом символе с достаточной историей (первый запуск)"""
+        for symbol, df in all_data.items():
+            prepared = self.signal_gen.prepare(df, symbol)
+            if prepared is not None:
+                self.ml.ensure_trained(prepared)
+                return
+    
+    def _persist_ohlcv(self, all_data: Dict[str, pd.DataFrame]):
+        """
+        Сохраняет OHLCV сканирования в Parquet-снапшот (zstd).
+        Нужен для теплого рестарта и офлайн-бэктестов; хранится OHLCV_SNAPSHOTS_KEEP последних файлов.
+        """
+        if not all_data:
+            return
+        try:
+            os.makedirs(OHLCV_CACHE_DIR, exist_ok=True)
+            ts = datetime.now().strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(OHLCV_CACHE_DIR, f"ohlcv_{ts}.parquet")
+            snapshot = pd.concat([df.assign(symbol=symbol) for symbol, df in all_data.items()])
+            snapshot.to_parquet(path, compression='zstd')
+            
+            snapshots = sorted(glob.glob(os.path.join(OHLCV_CACHE_DIR, "ohlcv_*.parquet")))
+            for old_path in snapshots[:-OHLCV_SNAPSHOTS_KEEP]:
+                os.remove(old_path)
+            logger.debug(f"OHLCV снапшот сохранен: {path}")
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения OHLCV снапшота: {e}")
+    
+    def _load_ohlcv_snapshot(self) -> Dict[str, pd.DataFrame]:
+        """Загружает последний Parquet-снапшот OHLCV (только нужные колонки)"""
+        snapshots = sorted(glob.glob(os.path.join(OHLCV_CACHE_DIR, "ohlcv_*.parquet")))
+        if not snapshots:
+            return {}
+        try:
+            snapshot = pd.read_parquet(
+                snapshots[-1], columns=['open', 'high', 'low', 'close', 'volume', 'symbol']
+            )
+            all_data = {}
+            for symbol, df in snapshot.groupby('symbol', sort=False):
+                # Снапшоты старых версий могли быть записаны во float64
+                df = df.drop(columns='symbol').astype(np.float32)
+                df.attrs['symbol'] = symbol
+                all_data[symbol] = df
+            logger.info(f"OHLCV снапшот загружен: {snapshots[-1]} ({len(all_data)} монет)")
+            return all_data
+        except Exception as e:
+            logger.warning(f"Ошибка загрузки OHLCV снапшота: {e}")
+            return {}
+    
+    async def _wait_persist(self):
+        """Дожидается фоновой записи снапшота OHLCV и логирует ее ошибку"""
+        future, self._persist_future = self._persist_future, None
+        if future is None:
+            return
+        try:
+            await future
+        except Exception as e:
+            logger.warning(f"Ошибка сохранения OHLCV снапшота: {e}")
+    
+    async def close(self):
+        """Освобождает ресурсы: сессию биржи, пулы потоков и процессов"""
+        await self._wait_persist()
+        await self.data_fetcher.close()
+        self._executor.shutdown(wait=False)
+        self._process_pool.shutdown(wait=False, cancel_futures=True)
+    
     def _format_signal_message(self, sig) -> str:
         """Форматирует сигнал для отправки в Telegram."""
         entry_a = sig.entry_a
         entry_b = sig.entry_b
         stop = sig.stop
-        tp1 = sig.tp1
-        tp2 = sig.tp2
-        tp3 = sig.tp3
         side = sig.side
         symbol = sig.symbol
         
@@ -165,45 +364,61 @@ class Engine:
         emoji = "🐂 Лонг" if is_long else "🐻 Шорт"
         entry_text = "(вход с текущих)" if not entry_b else "(2-фазный)"
         
-        message = f"*#{symbol}* {emoji} {entry_text}\n"
-        message += f"📊 Уверенность: {sig.confidence:.1%}\n\n"
+        parts: List[str] = [
+            f"*#{symbol}* {emoji} {entry_text}",
+            f"📊 Уверенность: {sig.confidence:.1%}",
+            "",
+        ]
         
         if entry_b:
-            message += "*Вход (2-фазный):*\n"
-            message += f"├ Вход A: `{entry_a:.4f}` ({POSITION_SIZE_A*100:.0f}%)\n"
-            message += f"└ Вход B: `{entry_b:.4f}` ({POSITION_SIZE_B*100:.0f}%)\n\n"
+            parts.append("*Вход (2-фазный):*")
+            parts.append(f"├ Вход A: `{entry_a:.4f}` ({POSITION_SIZE_A*100:.0f}%)")
+            parts.append(f"└ Вход B: `{entry_b:.4f}` ({POSITION_SIZE_B*100:.0f}%)")
         else:
-            message += f"*Вход:* `{entry_a:.4f}`\n\n"
+            parts.append(f"*Вход:* `{entry_a:.4f}`")
+        parts.append("")
         
         sl_perc_a = abs((entry_a - stop) / entry_a * 100)
+        sl_perc_b = abs((entry_b - stop) / entry_b * 100) if entry_b else None
         
         if entry_b:
-            sl_perc_b = abs((entry_b - stop) / entry_b * 100)
-            message += f"*Стоп-лосс:* `{stop:.4f}` 🛡️\n"
-            message += f"├ От A: -{sl_perc_a:.1f}%\n"
-            message += f"└ От B: -{sl_perc_b:.1f}%\n\n"
+            parts.append(f"*Стоп-лосс:* `{stop:.4f}` 🛡️")
+            parts.append(f"├ От A: -{sl_perc_a:.1f}%")
+            parts.append(f"└ От B: -{sl_perc_b:.1f}%")
         else:
-            message += f"*Стоп-лосс:* `{stop:.4f}` 🛡️ (-{sl_perc_a:.1f}%)\n\n"
+            parts.append(f"*Стоп-лосс:* `{stop:.4f}` 🛡️ (-{sl_perc_a:.1f}%)")
+        parts.append("")
         
-        message += "*Тейк-профиты:*\n"
+        # Проценты и R:R для всех трех TP считаются одной векторной операцией
+        tps = np.array([sig.tp1, sig.tp2, sig.tp3])
+        perc_a = np.abs((tps - entry_a) / entry_a * 100)
+        rr_a = perc_a / sl_perc_a if sl_perc_a > 0 else np.zeros_like(perc_a)
+        if entry_b:
+            perc_b = np.abs((tps - entry_b) / entry_b * 100)
+            rr_b = perc_b / sl_perc_b if sl_perc_b > 0 else np.zeros_like(perc_b)
         
-        for tp_num, tp in enumerate([tp1, tp2, tp3], 1):
-            perc_a = abs((tp - entry_a) / entry_a * 100)
-            rr_a = perc_a / sl_perc_a if sl_perc_a > 0 else 0
-            
+        parts.append("*Тейк-профиты:*")
+        for i, tp in enumerate(tps):
             if entry_b:
-                perc_b = abs((tp - entry_b) / entry_b * 100)
-                sl_perc_b = abs((entry_b - stop) / entry_b * 100)
-                rr_b = perc_b / sl_perc_b if sl_perc_b > 0 else 0
-                
-                connector = "├" if tp_num < 3 else "└"
-                message += f"{connector} TP{tp_num}: `{tp:.4f}` 🎯\n"
-                message += f"  (A: +{perc_a:.1f}% R:{rr_a:.1f} | B: +{perc_b:.1f}% R:{rr_b:.1f})\n"
+                parts.extend(self._format_tp_lines(i + 1, tp, perc_a[i], rr_a[i], perc_b[i], rr_b[i]))
             else:
-                connector = "├" if tp_num < 3 else "└"
-                message += f"{connector} TP{tp_num}: `{tp:.4f}` 🎯 (+{perc_a:.1f}%, R:{rr_a:.1f})\n"
+                parts.extend(self._format_tp_lines(i + 1, tp, perc_a[i], rr_a[i]))
         
-        return message
+        return "\n".join(parts)
+    
+    @staticmethod
+    def _format_tp_lines(tp_num: int, tp: float, perc_a: float, rr_a: float,
+                         perc_b: Optional[float] = None, rr_b: Optional[float] = None) -> List[str]:
+        """Форматирует строки одного тейк-профита с процентами и R:R от каждого входа."""
+        connector = "├" if tp_num < 3 else "└"
+        
+        if perc_b is None:
+            return [f"{connector} TP{tp_num}: `{tp:.4f}` 🎯 (+{perc_a:.1f}%, R:{rr_a:.1f})"]
+        
+        return [
+            f"{connector} TP{tp_num}: `{tp:.4f}` 🎯",
+            f"  (A: +{perc_a:.1f}% R:{rr_a:.1f} | B: +{perc_b:.1f}% R:{rr_b:.1f})",
+        ]
 
 
 engine = Engine()
@@ -249,6 +464,15 @@ async def post_init(application):
     logger.info(f"Планировщик запущен: сканирование каждые {SCAN_INTERVAL_HOURS}ч, проверка каждые {SIGNAL_CHECK_INTERVAL_MINUTES}мин")
 
 
+async def post_shutdown(application):
+    """Callback при остановке бота - останавливаем планировщик и освобождаем ресурсы движка"""
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    await engine.close()
+    await bot.close()
+    logger.info("Соединения закрыты")
+
+
 def main():
     """Главная функция запуска бота"""
     logger.info("=" * 50)
@@ -256,6 +480,7 @@ def main():
     logger.info("=" * 50)
     
     app.post_init = post_init
+    app.post_shutdown = post_shutdown
     
     logger.info("Запуск Telegram бота...")
     app.run_polling(drop_pending_updates=True)
@@ -6,15 +6,28 @@
 
 import pandas as pd
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
 import joblib
+import gc
 import os
 import logging
+import threading
 from datetime import datetime
 
-from config import ML_MODEL_PATH
+from config import (
+    ML_MODEL_PATH, ML_COMPILED_MODEL_PATH,
+    ML_N_ESTIMATORS, ML_MAX_DEPTH, ML_MIN_SAMPLES_LEAF, ML_MAX_FEATURES, ML_MAX_SAMPLES
+)
+
+try:
+    # Компиляция леса в нативную библиотеку: микросекунды на строку вместо
+    # миллисекунд диспетчеризации sklearn. Без пакетов работает sklearn.
+    import treelite
+    import tl2cgen
+except ImportError:
+    treelite = None
+    tl2cgen = None
 
 logger = logging.getLogger(__name__)
 
@@ -34,13 +47,26 @@ class MLPredictor:
     def __init__(self):
         """Инициализация ML модели"""
         self.model = RandomForestClassifier(
-            n_estimators=200,  # Количество деревьев
-            max_depth=10,  # Максимальная глубина дерева
+            n_estimators=ML_N_ESTIMATORS,  # Количество деревьев
+            max_depth=ML_MAX_DEPTH,  # Максимальная глубина дерева
+            min_samples_leaf=ML_MIN_SAMPLES_LEAF,
+            max_features=ML_MAX_FEATURES,
+            max_samples=ML_MAX_SAMPLES,  # Бутстрэп по части выборки ускоряет обучение
             random_state=42,  # Для воспроизводимости
             n_jobs=-1  # Использовать все ядра CPU
         )
         self.trained = False
         self.last_train_time: Optional[datetime] = None
+        # Скомпилированный предиктор tl2cgen; None - используется sklearn
+        self._compiled = None
+        # Индексы классов LONG/SHORT в выходе predict_proba; обновляются после fit/загрузки
+        self._class_idx: Optional[Tuple[int, int]] = None
+        
+        # Защищает авто-обучение, когда predict вызывается из нескольких потоков
+        self._train_lock = threading.Lock()
+        # Буфер признаков (1, N) на поток: predict не выделяет DataFrame/массив на каждый вызов
+        self._feat_cols = list(self.FEATURES)
+        self._local = threading.local()
         
         # Попытка загрузить сохраненную модель
         self._load_model()
@@ -54,11 +80,14 @@ class MLPredictor:
         """
         if os.path.exists(ML_MODEL_PATH):
             try:
-                saved_data = joblib.load(ML_MODEL_PATH)
+                # mmap_mode: массивы модели отображаются из файла, а не читаются в память целиком
+                saved_data = joblib.load(ML_MODEL_PATH, mmap_mode='r')
                 self.model = saved_data['model']
                 self.last_train_time = saved_data.get('train_time')
                 self.trained = True
+                self._update_class_indices()
                 logger.info(f"ML модель загружена из {ML_MODEL_PATH}")
+                self._load_compiled_model()
                 return True
             except Exception as e:
                 logger.warning(f"Ошибка загрузки модели: {e}")
@@ -71,10 +100,56 @@ class MLPredictor:
                 'model': self.model,
                 'train_time': self.last_train_time
             }
-            joblib.dump(saved_data, ML_MODEL_PATH)
+            # Без сжатия: joblib не умеет отображать в память сжатые файлы (mmap_mode в _load_model)
+            joblib.dump(saved_data, ML_MODEL_PATH, protocol=4)
             logger.info(f"ML модель сохранена в {ML_MODEL_PATH}")
         except Exception as e:
             logger.error(f"Ошибка сохранения модели: {e}")
+        
+        self._compile_model()
+    
+    def _compile_model(self) -> bool:
+        """
+        Компилирует обученный лес через Treelite в нативную библиотеку
+        и загружает её для предсказаний.
+        
+        Returns:
+            True если скомпилированная модель готова к использованию
+        """
+        if treelite is None:
+            return False
+        try:
+            tl_model = treelite.sklearn.import_model(self.model)
+            tl2cgen.export_lib(
+                tl_model, toolchain='gcc', libpath=ML_COMPILED_MODEL_PATH,
+                params={'parallel_comp': 4}
+            )
+            self._compiled = tl2cgen.Predictor(ML_COMPILED_MODEL_PATH)
+            logger.info(f"ML модель скомпилирована в {ML_COMPILED_MODEL_PATH}")
+            return True
+        except Exception as e:
+            self._compiled = None
+            logger.warning(f"Не удалось скомпилировать модель, используется sklearn: {e}")
+            return False
+    
+    def _load_compiled_model(self) -> bool:
+        """
+        Загружает скомпилированную модель, если она не старее сохраненной,
+        иначе компилирует заново.
+        
+        Returns:
+            True если скомпилированная модель готова к использованию
+        """
+        if tl2cgen is None:
+            return False
+        if (os.path.exists(ML_COMPILED_MODEL_PATH)
+                and os.path.getmtime(ML_COMPILED_MODEL_PATH) >= os.path.getmtime(ML_MODEL_PATH)):
+            try:
+                self._compiled = tl2cgen.Predictor(ML_COMPILED_MODEL_PATH)
+                return True
+            except Exception as e:
+                logger.warning(f"Ошибка загрузки скомпилированной модели: {e}")
+        return self._compile_model()
     
     def train_on_historical(self, df: pd.DataFrame) -> float:
         """
@@ -88,34 +163,42 @@ class MLPredictor:
         Returns:
             Точность модели на тестовой выборке
         """
-        df = df.copy()
-        
-        # Создаем целевую переменную
-        # 1 = цена вырастет (LONG), -1 = цена упадет (SHORT)
-        df['target'] = np.where(df['close'].shift(-1) > df['close'], 1, -1)
-        df.dropna(inplace=True)
-        
         # Проверяем наличие всех необходимых признаков
         missing_features = [f for f in self.FEATURES if f not in df.columns]
         if missing_features:
             logger.error(f"Отсутствуют признаки: {missing_features}")
             return 0.0
         
-        X = df[self.FEATURES]
-        y = df['target']
+        # Целевая переменная считается по массиву close без копии DataFrame:
+        # 1 = цена вырастет (LONG), -1 = цена упадет (SHORT).
+        # У последней свечи нет следующей, поэтому она в выборку не входит
+        close = df['close'].to_numpy()
+        y = np.where(close[1:] > close[:-1], 1, -1)
+        # float32: деревья sklearn внутри работают с float32, конвертация не повторяется
+        X = df[self.FEATURES].to_numpy(dtype=np.float32)[:-1]
+        
+        # Отбрасываем строки с NaN в признаках (прогрев индикаторов)
+        valid = ~np.isnan(X).any(axis=1)
+        X, y = X[valid], y[valid]
         
         # Проверка на достаточное количество данных
         if len(X) < 50:
             logger.warning(f"Недостаточно данных для обучения: {len(X)} строк")
             return 0.0
         
-        # Разделение на train/test
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=0.2, random_state=42, shuffle=False  # Не перемешиваем временные ряды
-        )
+        # Разделение на train/test: временные ряды не перемешиваем,
+        # поэтому первые 80% - обучение, последние 20% - тест
+        split = int(len(X) * 0.8)
+        X_train, X_test = X[:split], X[split:]
+        y_train, y_test = y[:split], y[split:]
         
         # Обучение модели
         self.model.fit(X_train, y_train)
+        # Освобождаем временные массивы бутстрэпа до компиляции и сохранения модели
+        gc.collect()
+        # Скомпилированная библиотека относится к старому лесу до перекомпиляции в _save_model
+        self._compiled = None
+        self._update_class_indices()
         self.trained = True
         self.last_train_time = datetime.now()
         
@@ -128,6 +211,63 @@ class MLPredictor:
         
         return accuracy
     
+    def _proba(self, X: np.ndarray) -> np.ndarray:
+        """
+        Вероятности классов для матрицы признаков (N, признаки).
+        Использует скомпилированную модель, при её отсутствии или ошибке - sklearn.
+        """
+        compiled = self._compiled
+        if compiled is not None:
+            try:
+                # tl2cgen возвращает (N, 1, классы)
+                return compiled.predict(tl2cgen.DMatrix(X)).reshape(len(X), -1)
+            except Exception as e:
+                logger.warning(f"Ошибка скомпилированной модели, используется sklearn: {e}")
+        return self.model.predict_proba(X)
+    
+    def ensure_trained(self, df: pd.DataFrame) -> bool:
+        """
+        Авто-обучение при первом запуске.
+        
+        Returns:
+            True если модель готова к предсказаниям
+        """
+        if not self.trained:
+            with self._train_lock:
+                # Повторная проверка: модель мог обучить другой поток, пока ждали блокировку
+                if not self.trained:
+                    logger.info("ML модель не обучена, запускаем обучение...")
+                    if self.train_on_historical(df) == 0.0:
+                        return False
+        return True
+    
+    def _update_class_indices(self):
+        """
+        Запоминает индексы классов LONG (1) и SHORT (-1) в выходе predict_proba.
+        Порядок классов меняется только при обучении, поэтому в предсказаниях не ищется.
+        """
+        # classes_: обычно [-1, 1] после обучения
+        classes = self.model.classes_
+        if len(classes) < 2:
+            self._class_idx = None
+            return
+        
+        idx_long = np.where(classes == 1)[0]
+        idx_short = np.where(classes == -1)[0]
+        if len(idx_long) > 0 and len(idx_short) > 0:
+            self._class_idx = (int(idx_long[0]), int(idx_short[0]))
+        else:
+            # Fallback если классы другие
+            self._class_idx = (1, 0)
+    
+    def _feature_buffer(self) -> np.ndarray:
+        """Возвращает буфер признаков (1, N) float32 текущего потока"""
+        buf = getattr(self._local, 'feat_buf', None)
+        if buf is None:
+            buf = np.empty((1, len(self._feat_cols)), dtype=np.float32)
+            self._local.feat_buf = buf
+        return buf
+    
     def predict(self, df: pd.DataFrame) -> Dict:
         """
         Предсказывает направление движения цены.
@@ -138,13 +278,9 @@ class MLPredictor:
         Returns:
             Словарь с направлением (1=LONG, -1=SHORT) и уверенностью (0-1)
         """
-        # Авто-обучение при первом запуске
-        if not self.trained:
-            logger.info("ML модель не обучена, запускаем обучение...")
-            accuracy = self.train_on_historical(df)
-            if accuracy == 0.0:
-                # Возвращаем нейтральный результат при ошибке
-                return {'direction': 0, 'confidence': 0.0}
+        if not self.ensure_trained(df):
+            # Возвращаем нейтральный результат при ошибке
+            return {'direction': 0, 'confidence': 0.0}
         
         # Проверяем наличие признаков
         missing_features = [f for f in self.FEATURES if f not in df.columns]
@@ -152,40 +288,26 @@ class MLPredictor:
             logger.warning(f"Отсутствуют признаки для предсказания: {missing_features}")
             return {'direction': 0, 'confidence': 0.0}
         
-        # Получаем последнюю строку данных
-        last_row = df.iloc[-1:][self.FEATURES]
+        # Последняя строка признаков копируется в заранее выделенный буфер потока
+        buf = self._feature_buffer()
+        buf[0] = df[self._feat_cols].to_numpy()[-1]
         
         # Проверка на NaN значения
-        if last_row.isnull().any().any():
+        if np.isnan(buf).any():
             logger.warning("NaN значения в признаках")
             return {'direction': 0, 'confidence': 0.0}
         
         try:
             # Предсказание вероятностей
-            proba = self.model.predict_proba(last_row)[0]
+            proba = self._proba(buf)[0]
             
-            # Определяем направление и уверенность
-            # classes_: обычно [-1, 1] после обучения
-            classes = self.model.classes_
+            if self._class_idx is None:
+                return {'direction': 0, 'confidence': 0.0}
             
-            if len(proba) >= 2:
-                # Находим индекс класса 1 (LONG) и -1 (SHORT)
-                idx_long = np.where(classes == 1)[0]
-                idx_short = np.where(classes == -1)[0]
-                
-                if len(idx_long) > 0 and len(idx_short) > 0:
-                    prob_long = proba[idx_long[0]]
-                    prob_short = proba[idx_short[0]]
-                else:
-                    # Fallback если классы другие
-                    prob_long = proba[1] if len(proba) > 1 else 0.5
-                    prob_short = proba[0]
-                
-                direction = 1 if prob_long > prob_short else -1
-                confidence = max(prob_long, prob_short)
-            else:
-                direction = 0
-                confidence = 0.0
+            prob_long = proba[self._class_idx[0]]
+            prob_short = proba[self._class_idx[1]]
+            direction = 1 if prob_long > prob_short else -1
+            confidence = prob_long if direction == 1 else prob_short
             
             return {'direction': direction, 'confidence': confidence}
             
@@ -193,6 +315,95 @@ class MLPredictor:
             logger.error(f"Ошибка предсказания ML: {e}")
             return {'direction': 0, 'confidence': 0.0}
     
+    def predict_batch(self, dfs: Dict[str, pd.DataFrame]) -> Dict[str, Dict]:
+        """
+        Предсказывает направление сразу для нескольких символов.
+        
+        Последние строки всех DataFrame собираются в одну матрицу (N, признаки),
+        и лес обходится одним вызовом predict_proba вместо N однострочных.
+        
+        Args:
+            dfs: Словарь {символ: DataFrame с рассчитанными индикаторами}
+            
+        Returns:
+            Словарь {символ: {'direction': 1/-1/0, 'confidence': 0-1}}
+        """
+        if not dfs:
+            return {}
+        
+        if not self.ensure_trained(next(iter(dfs.values()))):
+            return {symbol: {'direction': 0, 'confidence': 0.0} for symbol in dfs}
+        
+        results: Dict[str, Dict] = {}
+        rows: Dict[str, np.ndarray] = {}
+        for symbol, df in dfs.items():
+            missing_features = [f for f in self.FEATURES if f not in df.columns]
+            if missing_features:
+                logger.warning(f"{symbol}: отсутствуют признаки для предсказания: {missing_features}")
+                results[symbol] = {'direction': 0, 'confidence': 0.0}
+                continue
+            rows[symbol] = df[self.FEATURES].to_numpy()[-1]
+        
+        results.update(self.predict_rows(rows))
+        return results
+    
+    def predict_rows(self, rows: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        """
+        Предсказывает направление по готовым векторам признаков.
+        
+        Используется, когда индикаторы рассчитаны в других процессах
+        и в основной процесс передана только последняя строка признаков.
+        Модель должна быть обучена заранее (см. ensure_trained).
+        
+        Args:
+            rows: Словарь {символ: вектор признаков в порядке FEATURES}
+            
+        Returns:
+            Словарь {символ: {'direction': 1/-1/0, 'confidence': 0-1}}
+        """
+        neutral = {'direction': 0, 'confidence': 0.0}
+        if not rows:
+            return {}
+        
+        if not self.trained:
+            return {symbol: dict(neutral) for symbol in rows}
+        
+        results: Dict[str, Dict] = {}
+        symbols = []
+        valid = []
+        for symbol, row in rows.items():
+            if np.isnan(row).any():
+                logger.warning(f"{symbol}: NaN значения в признаках")
+                results[symbol] = dict(neutral)
+                continue
+            
+            symbols.append(symbol)
+            valid.append(row)
+        
+        if not valid:
+            return results
+        
+        try:
+            proba = self._proba(np.vstack(valid).astype(np.float32))
+            
+            if self._class_idx is None:
+                results.update({symbol: dict(neutral) for symbol in symbols})
+                return results
+            
+            prob_long = proba[:, self._class_idx[0]]
+            prob_short = proba[:, self._class_idx[1]]
+            directions = np.where(prob_long > prob_short, 1, -1)
+            confidences = np.maximum(prob_long, prob_short)
+            
+            for symbol, direction, confidence in zip(symbols, directions, confidences):
+                results[symbol] = {'direction': int(direction), 'confidence': float(confidence)}
+            
+        except Exception as e:
+            logger.error(f"Ошибка пакетного предсказания ML: {e}")
+            results.update({symbol: dict(neutral) for symbol in symbols})
+        
+        return results
+    
     def get_feature_importance(self) -> Dict[str, float]:
         """
         Возвращает важность признаков модели.
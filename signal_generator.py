@@ -4,17 +4,20 @@
 для формирования высококачественных сигналов
 """
 
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Optional
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
 import pandas as pd
 import logging
 
-from technical_analysis import TechnicalAnalyzer
+from technical_analysis import IndicatorState, TechnicalAnalyzer
 from ml_predictor import MLPredictor
 from config import (
     ENABLE_AVERAGING, AVERAGING_DISTANCE,
     ATR_MULTIPLIER_SL, ATR_MULTIPLIER_TP1, ATR_MULTIPLIER_TP2, ATR_MULTIPLIER_TP3,
-    MIN_CONFIDENCE, MIN_ADX, POSITION_SIZE_A, POSITION_SIZE_B
+    MIN_CONFIDENCE, MIN_ADX, POSITION_SIZE_A, POSITION_SIZE_B, INDICATOR_CACHE_SIZE
 )
 
 logger = logging.getLogger(__name__)
@@ -45,14 +48,145 @@ class Signal:
     confidence: float = 0.0
 
 
+# Колонки OHLCV в порядке передачи в процессы-воркеры
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# Анализатор процесса-воркера, создается при первом вызове process_symbol
+_worker_ta: Optional[TechnicalAnalyzer] = None
+
+
+def _compute_indicators(ta: TechnicalAnalyzer, df: pd.DataFrame,
+                        symbol: str) -> Optional[pd.DataFrame]:
+    """
+    Рассчитывает индикаторы и проверяет, что после прогрева осталось достаточно свечей.
+    
+    Returns:
+        DataFrame с индикаторами или None при ошибке / нехватке данных
+    """
+    try:
+        df = ta.add_all_indicators(df)
+    except Exception as e:
+        logger.error(f"Ошибка расчета индикаторов для {symbol}: {e}")
+        return None
+    
+    if len(df) < 10:
+        logger.debug(f"{symbol}: недостаточно данных после расчета индикаторов")
+        return None
+    
+    return df
+
+
+def _bar_key(df: pd.DataFrame) -> tuple:
+    """Ключ последней свечи - время и OHLCV: незакрытая свеча меняется при том же времени"""
+    return (df.index[-1], *df[OHLCV_COLUMNS].to_numpy()[-1].tolist())
+
+
+# LRU-кэши читаются и пополняются из пула потоков и из потока event loop
+_lru_lock = Lock()
+
+
+def _lru_get(cache: OrderedDict, key: tuple):
+    """Значение из LRU-кэша (None при промахе); найденная запись становится самой свежей"""
+    with _lru_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _lru_put(cache: OrderedDict, key: tuple, value):
+    """Кладет значение в LRU-кэш, вытесняя самые старые записи сверх INDICATOR_CACHE_SIZE"""
+    with _lru_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > INDICATOR_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def summarize(ta: TechnicalAnalyzer, df: pd.DataFrame) -> Dict:
+    """
+    Сводка по последней свече, достаточная для оценки сигнала.
+    
+    Args:
+        ta: Технический анализатор
+        df: DataFrame с рассчитанными индикаторами
+        
+    Returns:
+        Словарь: strength (результат get_signal_strength), adx, price, atr
+        и features - вектор признаков ML последней свечи
+    """
+    last = df.iloc[-1]
+    return {
+        'strength': ta.get_signal_strength(df),
+        'adx': float(last['adx']),
+        # float() - OHLCV хранится во float32, а sqlite3 принимает только python float
+        'price': float(last['close']),
+        'atr': float(last['atr']),
+        'features': df[MLPredictor.FEATURES].to_numpy(dtype=np.float32)[-1],
+    }
+
+
+def summarize_online(ta: TechnicalAnalyzer, state: IndicatorState, row: Dict[str, float]) -> Dict:
+    """
+    Сводка по незакрытой свече, рассчитанной онлайн (TechnicalAnalyzer.update).
+    
+    Args:
+        ta: Технический анализатор
+        state: Состояние индикаторов после предыдущей свечи
+        row: Результат update(state, bar) для незакрытой свечи
+        
+    Returns:
+        Словарь того же вида, что и summarize
+    """
+    return {
+        'strength': ta.get_signal_strength_online(state, row),
+        'adx': row['adx'],
+        'price': row['close'],
+        'atr': row['atr'],
+        'features': np.array([row[col] for col in MLPredictor.FEATURES], dtype=np.float32),
+    }
+
+
+def process_symbol(item: Tuple[str, np.ndarray, np.ndarray]
+                   ) -> Optional[Tuple[Dict, Optional[IndicatorState]]]:
+    """
+    Расчет индикаторов и сводки для одного символа в процессе-воркере.
+    
+    В процесс передаются только массивы времени и OHLCV, обратно - небольшая сводка
+    и состояние для онлайн-обновления, поэтому между процессами не пересылаются
+    DataFrame с индикаторами.
+    
+    Args:
+        item: (символ, время свечей, массив OHLCV (N, 5) в порядке OHLCV_COLUMNS)
+        
+    Returns:
+        (сводка (см. summarize), IndicatorState) или None, если данных недостаточно
+    """
+    global _worker_ta
+    if _worker_ta is None:
+        _worker_ta = TechnicalAnalyzer()
+    
+    symbol, index, ohlcv = item
+    raw = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS, index=pd.DatetimeIndex(index))
+    df = _compute_indicators(_worker_ta, raw, symbol)
+    if df is None:
+        return None
+    
+    try:
+        return summarize(_worker_ta, df), _worker_ta.init_state(raw)
+    except Exception as e:
+        logger.error(f"Ошибка расчета сводки для {symbol}: {e}")
+        return None
+
+
 class SignalGenerator:
     """
     Генератор торговых сигналов.
     
     Логика генерации:
-    1. Расчет технических индикаторов
+    1. Расчет технических индикаторов (prepare)
     2. Оценка силы сигнала через TA
-    3. Получение ML предсказания
+    3. Получение ML предсказания (по одному или пакетом через predict_batch)
     4. Проверка согласованности TA и ML
     5. Расчет уровней входа, SL и TP на основе ATR
     """
@@ -65,38 +199,160 @@ class SignalGenerator:
         """
         self.ta = ta
         self.ml = ml
+        # LRU-кэши по (символ, ключ последней свечи): DataFrame с индикаторами и сводки
+        # сканирования. Пересчет нужен только когда появилась новая свеча или обновилась
+        # текущая - /force незадолго до планового скана не считает те же свечи заново
+        self._ind_cache: OrderedDict[Tuple[str, tuple], pd.DataFrame] = OrderedDict()
+        self._summary_cache: OrderedDict[Tuple[str, tuple], Dict] = OrderedDict()
+        # Состояния онлайн-индикаторов по символам: сканирование досчитывает только новые свечи
+        self._states: Dict[str, IndicatorState] = {}
+    
+    def prepare(self, df: pd.DataFrame, symbol: str) -> Optional[pd.DataFrame]:
+        """
+        Рассчитывает технические индикаторы для символа.
+        
+        Args:
+            df: DataFrame с OHLCV данными
+            symbol: Торговая пара
+            
+        Returns:
+            DataFrame с индикаторами или None, если данных недостаточно
+        """
+        key = (symbol, _bar_key(df))
+        cached = _lru_get(self._ind_cache, key)
+        if cached is not None:
+            return cached
+        
+        df = _compute_indicators(self.ta, df, symbol)
+        if df is not None:
+            _lru_put(self._ind_cache, key, df)
+        return df
+    
+    def cache_summary(self, df: pd.DataFrame, symbol: str, summary: Dict):
+        """Запоминает сводку сканирования для последней свечи df"""
+        _lru_put(self._summary_cache, (symbol, _bar_key(df)), summary)
     
-    def generate(self, df: pd.DataFrame, symbol: str) -> Optional[Signal]:
+    def store_state(self, symbol: str, state: Optional[IndicatorState]):
+        """Сохраняет состояние онлайн-индикаторов символа (None - удаляет)"""
+        if state is None:
+            self._states.pop(symbol, None)
+        else:
+            self._states[symbol] = state
+    
+    def retain_states(self, symbols: Iterable[str]):
+        """Удаляет состояния символов, выбывших из сканирования"""
+        keep = set(symbols)
+        for symbol in [s for s in self._states if s not in keep]:
+            del self._states[symbol]
+    
+    def update_online(self, df: pd.DataFrame, symbol: str) -> Optional[Dict]:
+        """
+        Сводка последней свечи из кэша или по сохраненному состоянию индикаторов.
+        
+        Закрывшиеся с прошлого сканирования свечи фиксируются в состоянии,
+        последняя (незакрытая) рассчитывается без фиксации.
+        
+        Args:
+            df: DataFrame с OHLCV данными
+            symbol: Торговая пара
+            
+        Returns:
+            Сводка (см. summarize_online) или None, если состояния нет или оно
+            не стыкуется с данными - тогда нужен полный расчет
+        """
+        key = (symbol, _bar_key(df))
+        cached = _lru_get(self._summary_cache, key)
+        if cached is not None:
+            return cached
+        
+        state = self._states.get(symbol)
+        if state is None:
+            return None
+        
+        index = df.index
+        pos = index.searchsorted(state.timestamp)
+        if pos >= len(index) - 1 or index[pos] != state.timestamp:
+            # Разрыв в истории или новых свечей нет - состояние строится заново
+            del self._states[symbol]
+            return None
+        
+        bars = df[OHLCV_COLUMNS].to_numpy(dtype=np.float64)[pos + 1:]
+        try:
+            for ts, bar in zip(index[pos + 1:-1], bars[:-1]):
+                self.ta.update(state, bar, ts)
+            row = self.ta.update(state, bars[-1])
+            summary = summarize_online(self.ta, state, row)
+        except Exception as e:
+            logger.error(f"Ошибка онлайн-расчета индикаторов для {symbol}: {e}")
+            del self._states[symbol]
+            return None
+        _lru_put(self._summary_cache, key, summary)
+        return summary
+    
+    def generate(self, df: pd.DataFrame, symbol: str,
+                 ml_pred: Optional[Dict] = None) -> Optional[Signal]:
         """
         Генерирует торговый сигнал для указанного символа.
         
+        Args:
+            df: DataFrame с OHLCV данными
+            symbol: Торговая пара
+            ml_pred: Готовое ML предсказание (например, из MLPredictor.predict_batch);
+                если не передано, вызывается MLPredictor.predict
+            
+        Returns:
+            Signal если условия выполнены, иначе None
+        """
+        df = self.prepare(df, symbol)
+        if df is None:
+            return None
+        
+        if ml_pred is None:
+            ml_pred = self.ml.predict(df)
+        
+        return self.evaluate(df, symbol, ml_pred)
+    
+    def evaluate(self, df: pd.DataFrame, symbol: str, ml_pred: Dict) -> Optional[Signal]:
+        """
+        Оценивает подготовленные данные и ML предсказание и формирует сигнал.
+        
+        Args:
+            df: DataFrame с рассчитанными индикаторами (результат prepare)
+            symbol: Торговая пара
+            ml_pred: ML предсказание {'direction', 'confidence'}
+            
+        Returns:
+            Signal если условия выполнены, иначе None
+        """
+        try:
+            summary = summarize(self.ta, df)
+        except Exception as e:
+            logger.error(f"Ошибка генерации сигнала для {symbol}: {e}")
+            return None
+        return self.evaluate_summary(summary, symbol, ml_pred)
+    
+    def evaluate_summary(self, summary: Dict, symbol: str, ml_pred: Dict) -> Optional[Signal]:
+        """
+        Формирует сигнал по сводке последней свечи и ML предсказанию.
+        
         Условия генерации сигнала:
         1. Комбинированная уверенность (TA + ML) >= MIN_CONFIDENCE
         2. ADX >= MIN_ADX (подтверждение наличия тренда)
         3. Согласованность направления TA и ML
         
         Args:
-            df: DataFrame с OHLCV данными
+            summary: Сводка последней свечи (результат summarize / process_symbol)
             symbol: Торговая пара
+            ml_pred: ML предсказание {'direction', 'confidence'}
             
         Returns:
             Signal если условия выполнены, иначе None
         """
         try:
-            # Шаг 1: Добавляем все технические индикаторы
-            df = self.ta.add_all_indicators(df)
+            # Шаг 1: Сила сигнала из технического анализа
+            strength = summary['strength']
             
-            if len(df) < 10:
-                logger.debug(f"{symbol}: недостаточно данных после расчета индикаторов")
-                return None
-            
-            # Шаг 2: Получаем силу сигнала из технического анализа
-            strength = self.ta.get_signal_strength(df)
-            
-            # Шаг 3: Получаем ML предсказание
-            ml_pred = self.ml.predict(df)
-            
-            # Шаг 4: Проверяем комбинированную уверенность
+            # Шаг 2: Проверяем комбинированную уверенность
             # Среднее значение уверенности от TA и ML
             combined_conf = (strength['confidence'] + ml_pred['confidence']) / 2
             
@@ -104,13 +360,13 @@ class SignalGenerator:
                 logger.debug(f"{symbol}: низкая уверенность {combined_conf:.2f} < {MIN_CONFIDENCE}")
                 return None
             
-            # Шаг 5: Проверяем силу тренда через ADX
-            current_adx = df['adx'].iloc[-1]
+            # Шаг 3: Проверяем силу тренда через ADX
+            current_adx = summary['adx']
             if current_adx < MIN_ADX:
                 logger.debug(f"{symbol}: слабый тренд ADX={current_adx:.1f} < {MIN_ADX}")
                 return None
             
-            # Шаг 6: Проверяем согласованность TA и ML
+            # Шаг 4: Проверяем согласованность TA и ML
             direction = ml_pred['direction']
             net_score = strength['net_score']
             
@@ -119,33 +375,21 @@ class SignalGenerator:
                 logger.debug(f"{symbol}: несогласованность TA ({net_score}) и ML ({direction})")
                 return None
             
-            # Шаг 7: Определяем направление и рассчитываем уровни
+            # Шаг 5: Определяем направление и рассчитываем уровни
             side = "LONG" if direction == 1 else "SHORT"
-            price = df['close'].iloc[-1]
-            atr = df['atr'].iloc[-1]
-            
-            # Расчет дистанций на основе ATR
-            sl_dist = atr * ATR_MULTIPLIER_SL
-            tp1_dist = atr * ATR_MULTIPLIER_TP1
-            tp2_dist = atr * ATR_MULTIPLIER_TP2
-            tp3_dist = atr * ATR_MULTIPLIER_TP3
-            
-            if side == "LONG":
-                entry_a = price
-                # Усреднение ниже текущей цены для LONG
-                entry_b = price * (1 - AVERAGING_DISTANCE) if ENABLE_AVERAGING else None
-                stop = price - sl_dist
-                tp1 = price + tp1_dist
-                tp2 = price + tp2_dist
-                tp3 = price + tp3_dist
-            else:  # SHORT
-                entry_a = price
-                # Усреднение выше текущей цены для SHORT
-                entry_b = price * (1 + AVERAGING_DISTANCE) if ENABLE_AVERAGING else None
-                stop = price + sl_dist
-                tp1 = price - tp1_dist
-                tp2 = price - tp2_dist
-                tp3 = price - tp3_dist
+            price = summary['price']
+            atr = summary['atr']
+            
+            # Знак направления: +1 для LONG, -1 для SHORT.
+            # Стоп и усреднение - против направления сделки, TP - по направлению
+            sign = 1 if side == "LONG" else -1
+            
+            entry_a = price
+            entry_b = price * (1 - sign * AVERAGING_DISTANCE) if ENABLE_AVERAGING else None
+            stop = price - sign * atr * ATR_MULTIPLIER_SL
+            tp1 = price + sign * atr * ATR_MULTIPLIER_TP1
+            tp2 = price + sign * atr * ATR_MULTIPLIER_TP2
+            tp3 = price + sign * atr * ATR_MULTIPLIER_TP3
             
             signal = Signal(
                 symbol=symbol,
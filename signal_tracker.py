@@ -4,11 +4,15 @@
 отправляет уведомления и обновляет статистику
 """
 
-from typing import Dict, List, Optional
+import asyncio
+import numpy as np
+from typing import Dict, List, Optional, Tuple
 import logging
+import time
 
-from config import DB_NAME, POSITION_SIZE_A, POSITION_SIZE_B
+from config import DB_NAME, PRICE_CACHE_TTL_SECONDS
 from data_fetcher import DataFetcher
+from signal_tracker_numba import check_batch
 import database as db
 
 logger = logging.getLogger(__name__)
@@ -32,7 +36,8 @@ class SignalTracker:
         """
         self.fetcher = data_fetcher
         self.notifier = notifier
-        self.price_cache: Dict[str, float] = {}
+        # {символ: (цена, time.monotonic() момента получения)}
+        self.price_cache: Dict[str, Tuple[float, float]] = {}
     
     async def check_all_signals(self) -> List[Dict]:
         """
@@ -50,37 +55,91 @@ class SignalTracker:
             return results
         
         # Обновляем кэш цен для всех символов
-        symbols = list(set(s['symbol'] for s in active_signals))
+        symbols = list(set(s.symbol for s in active_signals))
         await self._update_prices(symbols)
         
-        # Проверяем каждый сигнал
-        for signal in active_signals:
-            result = await self._check_signal(signal)
-            if result:
-                results.append(result)
+        # Сигналы без актуальной цены не проверяем
+        active_signals = [s for s in active_signals if s.symbol in self.price_cache]
+        if not active_signals:
+            logger.debug("Нет актуальных цен для активных сигналов")
+            return results
+        
+        # Все сигналы сводятся в массивы: уровни [stop, tp1, tp2, tp3] и флаги TP - (N, 4) / (N, 3)
+        n = len(active_signals)
+        levels = np.empty((n, 4), dtype=np.float64)
+        tp_flags = np.empty((n, 3), dtype=bool)
+        entry_avg = np.empty(n, dtype=np.float64)
+        prices = np.empty(n, dtype=np.float64)
+        is_long = np.empty(n, dtype=bool)
+        for i, s in enumerate(active_signals):
+            levels[i] = (s.stop, s.tp1, s.tp2, s.tp3)
+            tp_flags[i] = (s.tp1_hit, s.tp2_hit, s.tp3_hit)
+            # Средневзвешенная цена входа рассчитана при открытии сделки
+            entry_avg[i] = (s.entry_avg if s.entry_avg is not None
+                            else self._calculate_weighted_entry(s.entry_a, s.entry_b))
+            prices[i] = self.price_cache[s.symbol][0]
+            is_long[i] = s.side == 'LONG'
+        
+        # Маски срабатываний SL/TP и PnL по всем уровням - одним пакетным вызовом
+        sl_hit, tp_new, pnl = check_batch(prices, levels, entry_avg, is_long, tp_flags)
+        
+        # Python-обработка только для сигналов, где что-то сработало
+        updates: List[Dict] = []
+        events: List[Dict] = []
+        for idx in np.flatnonzero(sl_hit | tp_new.any(axis=1)):
+            signal_events = self._check_signal(
+                active_signals[idx], prices[idx], sl_hit[idx], tp_new[idx], pnl[idx], updates
+            )
+            results.append(signal_events[0])
+            events.extend(signal_events)
+        
+        db.update_trades_batch(updates)
+        
+        # Уведомления - только после успешной записи в БД, одной пачкой
+        await self.notifier.send_signal_results(events)
         
         return results
     
     async def _update_prices(self, symbols: List[str]) -> None:
         """
-        Обновляет кэш текущих цен для списка символов.
+        Обновляет кэш текущих цен для списка символов одним запросом к бирже.
+        Символы, не попавшие в пакетный ответ, догружаются конкурентно.
+        Устаревшие цены и символы без открытых сделок удаляются из кэша.
         
         Args:
             symbols: Список торговых пар
         """
-        for symbol in symbols:
-            try:
-                price = self.fetcher.get_current_price(symbol)
-                if price > 0:
-                    self.price_cache[symbol] = price
-            except Exception as e:
-                logger.warning(f"Ошибка получения цены {symbol}: {e}")
+        prices = await self.fetcher.get_current_prices(symbols)
+        
+        missing = [s for s in symbols if s not in prices]
+        if missing:
+            # Запросы идут параллельно: общая задержка ≈ самому медленному, а не их сумме
+            results = await asyncio.gather(
+                *(self.fetcher.get_current_price(s) for s in missing),
+                return_exceptions=True
+            )
+            for symbol, price in zip(missing, results):
+                if isinstance(price, Exception):
+                    logger.warning(f"Ошибка получения цены {symbol}: {price}")
+                    continue
+                prices[symbol] = price
+        
+        now = time.monotonic()
+        for symbol, price in prices.items():
+            if price > 0:
+                self.price_cache[symbol] = (price, now)
+        
+        # Кэш ограничен символами открытых сделок и свежими ценами
+        self.price_cache = {
+            symbol: self.price_cache[symbol] for symbol in symbols
+            if symbol in self.price_cache
+            and now - self.price_cache[symbol][1] <= PRICE_CACHE_TTL_SECONDS
+        }
     
     def _calculate_weighted_entry(self, entry_a: float, entry_b: Optional[float]) -> float:
         """
         Рассчитывает средневзвешенную цену входа с учетом пропорций позиций.
-        
-        Формула: (entry_a * 70% + entry_b * 30%) / 100%
+        Используется для сделок, у которых entry_avg еще не сохранен в БД.
         
         Args:
             entry_a: Основная точка входа
@@ -89,136 +148,78 @@ class SignalTracker:
         Returns:
             Средневзвешенная цена входа
         """
-        if entry_b is None:
-            return entry_a
-        
-        # Используем веса из конфига
-        return (entry_a * POSITION_SIZE_A + entry_b * POSITION_SIZE_B)
+        return db.calc_entry_avg(entry_a, entry_b)
     
-    def _calculate_pnl(self, entry_avg: float, exit_price: float, is_long: bool) -> float:
+    def _check_signal(self, signal: db.SigRow, current_price: float, sl_hit: bool,
+                      tp_new: np.ndarray, pnl: np.ndarray, updates: List[Dict]) -> List[Dict]:
         """
-        Рассчитывает PnL в процентах.
-        
-        Args:
-            entry_avg: Средневзвешенная цена входа
-            exit_price: Цена выхода
-            is_long: True для LONG, False для SHORT
-            
-        Returns:
-            PnL в процентах
-        """
-        if is_long:
-            pnl = ((exit_price - entry_avg) / entry_avg) * 100
-        else:
-            pnl = ((entry_avg - exit_price) / entry_avg) * 100
-        return pnl
-    
-    async def _check_signal(self, signal: Dict) -> Optional[Dict]:
-        """
-        Проверяет один сигнал на достижение уровней.
+        Формирует события и изменения для сигнала, у которого сработал уровень.
         
         Логика:
-        1. Проверяем стоп-лосс (закрытие позиции)
-        2. Проверяем TP1, TP2 (уведомление, без закрытия)
-        3. Проверяем TP3 (закрытие позиции)
+        1. Стоп-лосс (закрытие позиции)
+        2. TP1, TP2 (уведомление, без закрытия)
+        3. TP3 (закрытие позиции)
+        
+        Сами сравнения с уровнями уже выполнены векторно в check_all_signals.
+        Изменения не пишутся сразу, а добавляются в updates.
         
         Args:
-            signal: Словарь с данными сигнала из БД
+            signal: Строка открытой сделки из БД
+            current_price: Текущая цена символа
+            sl_hit: Достигнут ли стоп-лосс
+            tp_new: Флаги впервые достигнутых TP1-TP3
+            pnl: PnL в процентах для уровней [stop, tp1, tp2, tp3]
+            updates: Накопитель изменений для db.update_trades_batch
             
         Returns:
-            Словарь с результатом или None
+            Список событий (STOP_LOSS, TP1, TP2, TP3_FULL) для уведомлений
         """
-        symbol = signal['symbol']
-        current_price = self.price_cache.get(symbol)
-        
-        if not current_price:
-            return None
-        
-        signal_id = signal['id']
-        direction = signal['side']
-        entry_a = signal['entry_a']
-        entry_b = signal['entry_b']
-        stop = signal['stop']
-        tp1 = signal['tp1']
-        tp2 = signal['tp2']
-        tp3 = signal['tp3']
-        
-        is_long = direction == 'LONG'
-        
-        # Рассчитываем средневзвешенную цену входа
-        entry_avg = self._calculate_weighted_entry(entry_a, entry_b)
-        
-        # === ПРОВЕРКА СТОП-ЛОССА ===
-        stop_hit = (is_long and current_price <= stop) or (not is_long and current_price >= stop)
-        
-        if stop_hit:
-            pnl = self._calculate_pnl(entry_avg, stop, is_long)
+        symbol = signal.symbol
+        current_price = float(current_price)
+        
+        update = {
+            'id': signal.id,
+            'tp1_hit': signal.tp1_hit,
+            'tp2_hit': signal.tp2_hit,
+            'tp3_hit': signal.tp3_hit,
+            'pnl': None
+        }
+        updates.append(update)
+        
+        # === СТОП-ЛОСС ===
+        if sl_hit:
+            sl_pnl = float(pnl[0])
             
-            # Закрываем сделку в БД
-            db.close_trade(signal_id, pnl)
+            # Закрываем сделку
+            update['pnl'] = sl_pnl
             
-            result = {
+            logger.info(f"❌ {symbol} - Стоп-лосс: {sl_pnl:.2f}%")
+            return [{
                 'type': 'STOP_LOSS',
                 'signal': signal,
                 'hit_price': current_price,
-                'pnl': pnl
-            }
-            
-            await self.notifier.send_signal_result(result)
-            logger.info(f"❌ {symbol} - Стоп-лосс: {pnl:.2f}%")
-            return result
+                'pnl': sl_pnl
+            }]
         
-        # === ПРОВЕРКА ТЕЙК-ПРОФИТОВ ===
+        # === ТЕЙК-ПРОФИТЫ ===
         tp_results = []
         
-        # TP1 - частичная фиксация, только уведомление
-        tp1_hit = (is_long and current_price >= tp1) or (not is_long and current_price <= tp1)
-        if tp1_hit and not db.is_tp_hit(signal_id, 1):
-            pnl = self._calculate_pnl(entry_avg, tp1, is_long)
-            db.mark_tp_hit(signal_id, 1)
-            
-            result = {
-                'type': 'TP1',
-                'signal': signal,
-                'hit_price': current_price,
-                'pnl': pnl
-            }
-            tp_results.append(result)
-            await self.notifier.send_signal_result(result)
-            logger.info(f"🎯 {symbol} - TP1 достигнут: +{pnl:.2f}%")
-        
-        # TP2 - частичная фиксация, только уведомление
-        tp2_hit = (is_long and current_price >= tp2) or (not is_long and current_price <= tp2)
-        if tp2_hit and not db.is_tp_hit(signal_id, 2):
-            pnl = self._calculate_pnl(entry_avg, tp2, is_long)
-            db.mark_tp_hit(signal_id, 2)
-            
-            result = {
-                'type': 'TP2',
-                'signal': signal,
-                'hit_price': current_price,
-                'pnl': pnl
-            }
-            tp_results.append(result)
-            await self.notifier.send_signal_result(result)
-            logger.info(f"🎯 {symbol} - TP2 достигнут: +{pnl:.2f}%")
-        
-        # TP3 - полное закрытие позиции
-        tp3_hit = (is_long and current_price >= tp3) or (not is_long and current_price <= tp3)
-        if tp3_hit and not db.is_tp_hit(signal_id, 3):
-            pnl = self._calculate_pnl(entry_avg, tp3, is_long)
+        # TP1, TP2 - частичная фиксация, только уведомление; TP3 - полное закрытие позиции
+        for level in np.flatnonzero(tp_new) + 1:
+            tp_pnl = float(pnl[level])
+            update[f'tp{level}_hit'] = 1
             
-            db.mark_tp_hit(signal_id, 3)
-            db.close_trade(signal_id, pnl)
+            if level == 3:
+                update['pnl'] = tp_pnl
+                logger.info(f"🏆 {symbol} - TP3 достигнут (закрыто): +{tp_pnl:.2f}%")
+            else:
+                logger.info(f"🎯 {symbol} - TP{level} достигнут: +{tp_pnl:.2f}%")
             
-            result = {
-                'type': 'TP3_FULL',
+            tp_results.append({
+                'type': 'TP3_FULL' if level == 3 else f'TP{level}',
                 'signal': signal,
                 'hit_price': current_price,
-                'pnl': pnl
-            }
-            tp_results.append(result)
-            await self.notifier.send_signal_result(result)
-            logger.info(f"🏆 {symbol} - TP3 достигнут (закрыто): +{pnl:.2f}%")
+                'pnl': tp_pnl
+            })
         
-        return tp_results[0] if tp_results else None
+        return tp_results
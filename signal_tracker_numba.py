@@ -0,0 +1,83 @@
+"""
+Модуль пакетной проверки сигналов
+Определяет срабатывания SL/TP и PnL сразу для всех активных сигналов.
+При наличии Numba проверка компилируется в машинный код с параллельным циклом,
+без Numba используется векторная реализация на NumPy
+"""
+
+from typing import Tuple
+import logging
+
+import numpy as np
+
+try:
+    from numba import njit, prange, types
+except ImportError:
+    njit = None
+
+logger = logging.getLogger(__name__)
+
+
+def _check_batch_numpy(prices: np.ndarray, levels: np.ndarray, entry_avg: np.ndarray,
+                       is_long: np.ndarray,
+                       tp_flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Векторная проверка уровней на NumPy (fallback без Numba).
+
+    Args:
+        prices: Текущие цены (N,); NaN - цены нет, сигнал не срабатывает
+        levels: Уровни [stop, tp1, tp2, tp3] (N, 4)
+        entry_avg: Средневзвешенные цены входа (N,)
+        is_long: True для LONG (N,)
+        tp_flags: Уже достигнутые TP1-TP3 (N, 3)
+
+    Returns:
+        (sl_hit (N,), tp_new (N, 3) - впервые достигнутые TP, pnl (N, 4) в процентах по уровням)
+    """
+    # LONG - цена ниже стопа / выше TP, SHORT - наоборот
+    price_col = prices[:, None]
+    long_col = is_long[:, None]
+    reached = np.where(long_col, price_col >= levels, price_col <= levels)
+    sl_hit = np.where(is_long, prices <= levels[:, 0], prices >= levels[:, 0])
+    tp_new = reached[:, 1:] & ~tp_flags
+    entry_col = entry_avg[:, None]
+    pnl = np.where(long_col, levels - entry_col, entry_col - levels) / entry_col * 100
+    return sl_hit, tp_new, pnl
+
+
+if njit is not None:
+    # Явная сигнатура: компиляция при импорте модуля, а не на первом вызове в цикле проверки
+    _SIGNATURE = types.Tuple((types.boolean[:], types.boolean[:, :], types.float64[:, :]))(
+        types.float64[:], types.float64[:, :], types.float64[:],
+        types.boolean[:], types.boolean[:, :]
+    )
+
+    @njit(_SIGNATURE, parallel=True, cache=True)
+    def _check_batch_numba(prices, levels, entry_avg, is_long, tp_flags):
+        """Проверка уровней, скомпилированная Numba; сигналы обрабатываются параллельно"""
+        n = prices.shape[0]
+        sl_hit = np.zeros(n, dtype=np.bool_)
+        tp_new = np.zeros((n, 3), dtype=np.bool_)
+        pnl = np.empty((n, 4), dtype=np.float64)
+
+        for i in prange(n):
+            price = prices[i]
+            entry = entry_avg[i]
+            sign = 1.0 if is_long[i] else -1.0
+
+            for j in range(4):
+                pnl[i, j] = sign * (levels[i, j] - entry) / entry * 100
+
+            # Сравнения с NaN дают False: сигналы без цены не срабатывают
+            sl_hit[i] = price <= levels[i, 0] if is_long[i] else price >= levels[i, 0]
+            for j in range(3):
+                tp = levels[i, j + 1]
+                reached = price >= tp if is_long[i] else price <= tp
+                tp_new[i, j] = reached and not tp_flags[i, j]
+
+        return sl_hit, tp_new, pnl
+
+    check_batch = _check_batch_numba
+else:
+    logger.info("Numba не установлена, проверка сигналов выполняется на NumPy")
+    check_batch = _check_batch_numpy
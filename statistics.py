@@ -28,82 +28,21 @@ class StatisticsManager:
         Returns:
             Словарь со статистикой: total, wins, losses, winrate, pnl и т.д.
         """
-        # Базовая статистика из БД
-        total, wins, total_pnl = db.stats()
-        losses = total - wins if total > 0 else 0
-        
-        # Статистика по TP уровням
-        tp_stats = db.get_tp_stats()
-        
-        stats = {
-            'total': total,
-            'wins': wins,
-            'losses': losses,
-            'winrate': (wins / total * 100) if total > 0 else 0.0,
-            'total_pnl': total_pnl,
-            'avg_pnl': (total_pnl / total) if total > 0 else 0.0,
-            'tp1_hits': tp_stats['tp1_hits'],
-            'tp2_hits': tp_stats['tp2_hits'],
-            'tp3_hits': tp_stats['tp3_hits']
-        }
-        
-        # Дополнительные метрики
-        if stats['total'] > 0:
-            stats['loss_rate'] = 100 - stats['winrate']
-            
-            # Средний выигрыш (только для прибыльных сделок)
-            if wins > 0 and total_pnl > 0:
-                stats['avg_win'] = total_pnl / wins
-            else:
-                stats['avg_win'] = 0.0
-            
-            # Profit Factor (упрощенный)
-            stats['profit_factor'] = abs(stats['avg_pnl']) if stats['avg_pnl'] != 0 else 0.0
-        else:
-            stats['loss_rate'] = 0.0
-            stats['avg_win'] = 0.0
-            stats['profit_factor'] = 0.0
-        
-        return stats
+        # Агрегаты и производные метрики считаются в SQL одним запросом
+        return db.get_full_stats(days)
     
-    async def get_best_performers(self, limit: int = 5) -> List[Dict]:
+    async def get_best_performers(self, limit: int = 5, days: int = 30) -> List[Dict]:
         """
         Получает список лучших монет по прибыльности.
         
         Args:
             limit: Максимальное количество монет в списке
+            days: Количество дней для анализа
             
         Returns:
             Список словарей с данными по каждой монете
         """
-        from database import get_connection
-        
-        with get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT symbol, 
-                       COUNT(*) as total,
-                       SUM(CASE WHEN pnl > 0 THEN 1 ELSE 0 END) as wins,
-                       SUM(CASE WHEN pnl < 0 THEN 1 ELSE 0 END) as losses,
-                       SUM(pnl) as total_pnl
-                FROM trades
-                WHERE status = 'CLOSED'
-                GROUP BY symbol
-                ORDER BY total_pnl DESC
-                LIMIT ?
-            """, (limit,))
-            
-            results = []
-            for row in cursor.fetchall():
-                symbol, total, wins, losses, pnl = row
-                results.append({
-                    'symbol': symbol,
-                    'total': total,
-                    'wins': wins or 0,
-                    'losses': losses or 0,
-                    'pnl': pnl or 0.0
-                })
-            
-            return results
+        return db.get_best_performers(limit, days)
     
     async def format_stats_message(self, days: int = 30) -> str:
         """
@@ -116,31 +55,32 @@ class StatisticsManager:
             Отформатированное сообщение в Markdown
         """
         stats = await self.get_full_stats(days)
-        best = await self.get_best_performers(5)
+        best = await self.get_best_performers(5, days)
         
-        # Формируем сообщение
-        message = f"""
-📊 *Статистика за {days} дней*
-
-📈 *Общие показатели:*
-├ Всего сигналов: {stats['total']}
-├ Выигрышных: {stats['wins']} ✅
-├ Проигрышных: {stats['losses']} ❌
-├ Winrate: {stats['winrate']:.1f}%
-└ Общий PnL: {stats['total_pnl']:+.2f}%
-
-🎯 *Тейк-профиты:*
-├ TP1 достигнут: {stats['tp1_hits']} раз
-├ TP2 достигнут: {stats['tp2_hits']} раз
-└ TP3 достигнут: {stats['tp3_hits']} раз
-"""
+        # Формируем сообщение списком строк и собираем одним join
+        parts = [
+            f"📊 *Статистика за {days} дней*",
+            "",
+            "📈 *Общие показатели:*",
+            f"├ Всего сигналов: {stats['total']}",
+            f"├ Выигрышных: {stats['wins']} ✅",
+            f"├ Проигрышных: {stats['losses']} ❌",
+            f"├ Winrate: {stats['winrate']:.1f}%",
+            f"└ Общий PnL: {stats['total_pnl']:+.2f}%",
+            "",
+            "🎯 *Тейк-профиты:*",
+            f"├ TP1 достигнут: {stats['tp1_hits']} раз",
+            f"├ TP2 достигнут: {stats['tp2_hits']} раз",
+            f"└ TP3 достигнут: {stats['tp3_hits']} раз",
+        ]
         
         # Добавляем лучшие монеты
         if best:
-            message += "\n🏆 *Лучшие монеты:*\n"
+            parts.append("")
+            parts.append("🏆 *Лучшие монеты:*")
             for i, b in enumerate(best, 1):
                 total = b['wins'] + b['losses']
-                wr = (b['wins'] / total * 100) if total > 0 else 0
-                message += f"├ {i}. {b['symbol']}: {b['pnl']:+.2f}% (WR: {wr:.0f}%)\n"
+                wr = b['wins'] / total * 100 if total > 0 else 0
+                parts.append(f"├ {i}. {b['symbol']}: {b['pnl']:+.2f}% (WR: {wr:.0f}%)")
         
-        return message.strip()
+        return "\n".join(parts)
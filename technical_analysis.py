@@ -6,12 +6,462 @@
 
 import pandas as pd
 import numpy as np
+import bottleneck as bn
 import ta
-from typing import Dict
+from dataclasses import dataclass
+from typing import Dict, Optional
 import logging
 
+try:
+    from numba import njit
+except ImportError:
+    # Без Numba ядра индикаторов выполняются как обычные Python-функции
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 logger = logging.getLogger(__name__)
 
+# Колонки, используемые в get_signal_strength (порядок совпадает с распаковкой строки)
+_SIG_COLS = [
+    'rsi', 'macd', 'macd_signal', 'sma_20', 'sma_50', 'close', 'open',
+    'bb_lower', 'bb_upper', 'stoch_k', 'stoch_d', 'adx', 'volume_ratio',
+]
+
+# Веса условий в get_signal_strength - общие для масок bull и bear (условия идут парами)
+_SIGNAL_WEIGHTS = np.array([2, 1, 2, 1, 2, 2, 1, 1], dtype=np.int8)
+
+# Колонки индикаторов add_all_indicators в порядке их добавления к OHLCV
+_INDICATOR_COLUMNS = [
+    'sma_10', 'sma_20', 'sma_50', 'sma_100', 'ema_12', 'ema_26', 'macd', 'macd_signal',
+    'macd_histogram', 'adx', 'adx_pos', 'adx_neg', 'ichimoku_a', 'ichimoku_b',
+    'ichimoku_base', 'ichimoku_conv', 'rsi', 'rsi_6', 'stoch_k', 'stoch_d',
+    'williams_r', 'roc', 'bb_upper', 'bb_middle', 'bb_lower', 'bb_width', 'bb_pband',
+    'atr', 'atr_percent', 'kc_upper', 'kc_middle', 'kc_lower', 'dc_upper', 'dc_lower',
+    'obv', 'volume_sma_20', 'volume_ratio', 'cmf', 'psar', 'vortex_pos', 'vortex_neg',
+]
+_COL = {name: i for i, name in enumerate(_INDICATOR_COLUMNS)}
+
+
+def _bbands(close: np.ndarray, mid: np.ndarray, n: int = 20, k: float = 2.0) -> tuple:
+    """
+    Полосы Боллинджера из уже посчитанной скользящей средней.
+    
+    Args:
+        close: Цены закрытия
+        mid: Скользящая средняя close за n свечей (средняя линия)
+        n: Период
+        k: Множитель стандартного отклонения
+        
+    Returns:
+        (upper, lower, width в % от средней, pband - позиция цены в канале)
+    """
+    sd = bn.move_std(close, n, min_count=n, ddof=0)
+    upper = mid + k * sd
+    lower = mid - k * sd
+    width = (upper - lower) / mid * 100
+    band = upper - lower
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pband = (close - lower) / np.where(band != 0, band, np.nan)
+    return upper, lower, width, pband
+
+
+def _keltner(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 20) -> tuple:
+    """
+    Канал Кельтнера в классическом варианте (original_version в ta):
+    средние типичной цены и ее смещенных вариантов за n свечей.
+    
+    Returns:
+        (upper, middle, lower)
+    """
+    middle = bn.move_mean((high + low + close) / 3.0, n, min_count=n)
+    # Границы в ta считаются с min_periods=0 - по неполному окну с первой свечи
+    upper = bn.move_mean((4 * high - 2 * low + close) / 3.0, n, min_count=1)
+    lower = bn.move_mean((-2 * high + 4 * low + close) / 3.0, n, min_count=1)
+    return upper, middle, lower
+
+
+def _donchian(high: np.ndarray, low: np.ndarray, n: int = 20) -> tuple:
+    """
+    Канал Дончиана: максимум high и минимум low за n свечей.
+    
+    Returns:
+        (upper, lower)
+    """
+    return bn.move_max(high, n, min_count=n), bn.move_min(low, n, min_count=n)
+
+
+def _stochastic(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                n: int = 14, smooth: int = 3) -> tuple:
+    """
+    Stochastic Oscillator и Williams %R из общих экстремумов окна n.
+    
+    Максимум/минимум окна считаются Bottleneck за O(N) независимо от n;
+    формулы совпадают с ta (StochasticOscillator, williams_r).
+    
+    Returns:
+        (stoch_k, stoch_d - SMA(smooth) от stoch_k, williams_r)
+    """
+    highest = bn.move_max(high, n, min_count=n)
+    lowest = bn.move_min(low, n, min_count=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stoch_k = 100 * (close - lowest) / (highest - lowest)
+        williams_r = -100 * (highest - close) / (highest - lowest)
+    stoch_d = bn.move_mean(stoch_k, smooth, min_count=smooth)
+    return stoch_k, stoch_d, williams_r
+
+
+@njit(cache=True)
+def _ema(x: np.ndarray, n: int) -> np.ndarray:
+    """
+    Экспоненциальная скользящая средняя с alpha = 2 / (n + 1).
+    
+    Совпадает с ewm(span=n, adjust=False, min_periods=n) (как в ta):
+    рекурсия стартует с первого не-NaN значения, первые n - 1 значений - NaN.
+    
+    Args:
+        x: Входной ряд (допускаются NaN в начале)
+        n: Период
+        
+    Returns:
+        Массив EMA той же длины
+    """
+    out = np.full(x.shape[0], np.nan)
+    alpha = 2.0 / (n + 1.0)
+    count = 0
+    prev = 0.0
+    for i in range(x.shape[0]):
+        v = x[i]
+        if np.isnan(v):
+            if count >= n:
+                out[i] = prev
+            continue
+        prev = v if count == 0 else alpha * v + (1.0 - alpha) * prev
+        count += 1
+        if count >= n:
+            out[i] = prev
+    return out
+
+
+@njit(cache=True)
+def _rsi_state(close: np.ndarray, n: int) -> tuple:
+    """
+    RSI со сглаживанием Уайлдера за один проход по ценам.
+    
+    Совпадает с ta.momentum.rsi: средние роста/падения - ewm(alpha=1/n, adjust=False)
+    с нулевым первым приращением, первые n - 1 значений - NaN, при нулевом падении - 100.
+    
+    Args:
+        close: Цены закрытия
+        n: Период
+        
+    Returns:
+        (массив RSI той же длины, средний рост и среднее падение на последней свече)
+    """
+    out = np.full(close.shape[0], np.nan)
+    alpha = 1.0 / n
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(1, close.shape[0]):
+        delta = close[i] - close[i - 1]
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        avg_gain = alpha * gain + (1.0 - alpha) * avg_gain
+        avg_loss = alpha * loss + (1.0 - alpha) * avg_loss
+        if i >= n - 1:
+            out[i] = 100.0 if avg_loss == 0 else 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return out, avg_gain, avg_loss
+
+
+@njit(cache=True)
+def _rsi(close: np.ndarray, n: int) -> np.ndarray:
+    """RSI со сглаживанием Уайлдера (см. _rsi_state)"""
+    return _rsi_state(close, n)[0]
+
+
+@njit(cache=True)
+def _atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int) -> np.ndarray:
+    """
+    ATR: True Range и сглаживание Уайлдера в одном проходе.
+    
+    Совпадает с ta.volatility.average_true_range: TR первой свечи - high - low,
+    первые n - 1 значений - нули, затем среднее TR за n свечей и рекурсия Уайлдера.
+    
+    Args:
+        high, low, close: Ряды цен
+        n: Период
+        
+    Returns:
+        Массив ATR той же длины
+    """
+    size = close.shape[0]
+    out = np.zeros(size)
+    if size < n:
+        return out
+    
+    tr_sum = 0.0
+    for i in range(size):
+        tr = high[i] - low[i]
+        if i > 0:
+            tr = max(tr, abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+        if i < n:
+            tr_sum += tr
+            if i == n - 1:
+                out[i] = tr_sum / n
+        else:
+            out[i] = (out[i - 1] * (n - 1) + tr) / n
+    return out
+
+
+@njit(cache=True)
+def _adx(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int) -> tuple:
+    """
+    ADX, +DI и -DI за один проход по свечам.
+    
+    Повторяет ta.trend.ADXIndicator: суммы Уайлдера TR/+DM/-DM стартуют с суммы
+    за свечи 1..n, первое значение ADX (свеча 2n - 1) - среднее DX за n свечей,
+    до него ADX равен нулю; +DI/-DI на свече n равны нулю.
+    
+    Args:
+        high, low, close: Ряды цен (не короче 2n)
+        n: Период
+        
+    Returns:
+        (adx, adx_pos, adx_neg, массив [TR, +DM, -DM] - суммы Уайлдера на последней свече)
+    """
+    size = close.shape[0]
+    adx = np.zeros(size)
+    adx_pos = np.zeros(size)
+    adx_neg = np.zeros(size)
+    trs = 0.0
+    dip = 0.0
+    din = 0.0
+    dx_sum = 0.0
+    adx_val = 0.0
+    for i in range(1, size):
+        tr = max(high[i], close[i - 1]) - min(low[i], close[i - 1])
+        up = high[i] - high[i - 1]
+        down = low[i - 1] - low[i]
+        pos = up if up > down and up > 0 else 0.0
+        neg = down if down > up and down > 0 else 0.0
+        if i <= n:
+            trs += tr
+            dip += pos
+            din += neg
+        else:
+            trs = trs - trs / n + tr
+            dip = dip - dip / n + pos
+            din = din - din / n + neg
+        if i < n:
+            continue
+        
+        di_pos = 100.0 * dip / trs if trs != 0 else 0.0
+        di_neg = 100.0 * din / trs if trs != 0 else 0.0
+        dx = 100.0 * abs(di_pos - di_neg) / (di_pos + di_neg) if di_pos + di_neg != 0 else 0.0
+        if i > n:
+            adx_pos[i] = di_pos
+            adx_neg[i] = di_neg
+        
+        k = i - n
+        if k < n:
+            dx_sum += dx
+            if k == n - 1:
+                adx_val = dx_sum / n
+                adx[i] = adx_val
+        else:
+            adx_val = (adx_val * (n - 1) + dx) / n
+            adx[i] = adx_val
+    return adx, adx_pos, adx_neg, np.array([trs, dip, din])
+
+
+@njit(cache=True)
+def _multi_sma(x: np.ndarray, windows: np.ndarray) -> np.ndarray:
+    """
+    Несколько SMA за один проход по ряду.
+    
+    Для каждого окна ведется скользящая сумма (как в bn.move_mean), так что
+    ряд читается один раз вместо отдельного прохода на каждое окно.
+    
+    Args:
+        x: Входной ряд без NaN
+        windows: Периоды SMA
+        
+    Returns:
+        Массив (len(windows), len(x)); первые window - 1 значений каждой строки - NaN
+    """
+    n = x.shape[0]
+    m = windows.shape[0]
+    out = np.full((m, n), np.nan)
+    sums = np.zeros(m)
+    for i in range(n):
+        v = x[i]
+        for k in range(m):
+            w = windows[k]
+            sums[k] += v
+            if i >= w:
+                sums[k] -= x[i - w]
+            if i >= w - 1:
+                out[k, i] = sums[k] / w
+    return out
+
+
+@njit(cache=True)
+def _psar(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+          step: float = 0.02, max_step: float = 0.2) -> np.ndarray:
+    """
+    Parabolic SAR - тот же цикл, что в ta.trend.PSARIndicator, по массивам.
+    
+    Первые две свечи - close, затем SAR с ускорением step (до max_step)
+    и разворотом при пробое. SAR не заходит за экстремумы двух предыдущих свечей.
+    
+    Args:
+        high, low, close: Ряды цен
+        step: Шаг фактора ускорения
+        max_step: Максимальный фактор ускорения
+        
+    Returns:
+        Массив PSAR той же длины
+    """
+    size = close.shape[0]
+    out = close.copy()
+    if size == 0:
+        return out
+    up_trend = True
+    af = step
+    up_trend_high = high[0]
+    down_trend_low = low[0]
+    
+    for i in range(2, size):
+        reversal = False
+        max_high = high[i]
+        min_low = low[i]
+        
+        if up_trend:
+            sar = out[i - 1] + af * (up_trend_high - out[i - 1])
+            if min_low < sar:
+                reversal = True
+                sar = up_trend_high
+                down_trend_low = min_low
+                af = step
+            else:
+                if max_high > up_trend_high:
+                    up_trend_high = max_high
+                    af = min(af + step, max_step)
+                if low[i - 2] < sar:
+                    sar = low[i - 2]
+                elif low[i - 1] < sar:
+                    sar = low[i - 1]
+        else:
+            sar = out[i - 1] - af * (out[i - 1] - down_trend_low)
+            if max_high > sar:
+                reversal = True
+                sar = down_trend_low
+                up_trend_high = max_high
+                af = step
+            else:
+                if min_low < down_trend_low:
+                    down_trend_low = min_low
+                    af = min(af + step, max_step)
+                if high[i - 2] > sar:
+                    sar = high[i - 2]
+                elif high[i - 1] > sar:
+                    sar = high[i - 1]
+        
+        out[i] = sar
+        up_trend = up_trend != reversal
+    return out
+
+
+def _vortex(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> tuple:
+    """
+    Vortex Indicator (как ta.trend.VortexIndicator): суммы |H - L[-1]| и |L - H[-1]|
+    за n свечей, деленные на сумму True Range.
+    
+    Returns:
+        (vortex_pos, vortex_neg); первые n значений - NaN
+    """
+    # Как в ta: предыдущий close для первой свечи - среднее close
+    prev_close = np.empty_like(close)
+    prev_close[0] = close.mean()
+    prev_close[1:] = close[:-1]
+    true_range = np.maximum(high, prev_close) - np.minimum(low, prev_close)
+    trn = bn.move_sum(true_range, n, min_count=n)
+    
+    vmp = np.full_like(close, np.nan)
+    vmm = np.full_like(close, np.nan)
+    vmp[1:] = np.abs(high[1:] - low[:-1])
+    vmm[1:] = np.abs(low[1:] - high[:-1])
+    return bn.move_sum(vmp, n, min_count=n) / trn, bn.move_sum(vmm, n, min_count=n) / trn
+
+
+# Периоды SMA по close, считаются одним вызовом _multi_sma
+_SMA_WINDOWS = np.array([10, 20, 50, 100], dtype=np.int64)
+
+
+def _warmup_kernels():
+    """
+    Компилирует Numba-ядра при импорте модуля, а не на первом сканировании.
+    Благодаря cache=True при повторных запусках машинный код читается с диска.
+    Покрываются изменяемые массивы (копии float32 OHLCV) и read-only
+    представления колонок float64, которые отдает pandas (Copy-on-Write).
+    """
+    writable = np.linspace(1.0, 2.0, 32)
+    readonly = writable.copy()
+    readonly.flags.writeable = False
+    for arr in (writable, readonly):
+        _ema(arr, 12)
+        _rsi(arr, 14)
+        _atr(arr, arr, arr, 14)
+        _adx(arr, arr, arr, 14)
+        _multi_sma(arr, _SMA_WINDOWS)
+        _psar(arr, arr, arr)
+
+
+_warmup_kernels()
+
+
+@dataclass
+class IndicatorState:
+    """
+    Состояние индикаторов после последней закрытой свечи.
+    Позволяет считать индикаторы новой свечи без пересчета всей истории.
+    
+    Attributes:
+        timestamp: Время последней зафиксированной свечи
+        closes: Последние 50 цен закрытия (SMA20/SMA50, Bollinger Bands)
+        highs: Последние 14 максимумов (Stochastic)
+        lows: Последние 14 минимумов (Stochastic)
+        volumes: Последние 20 объемов (Volume SMA)
+        stoch_k: Последние 2 значения %K (сглаживание %D)
+        ema_12: EMA12
+        ema_26: EMA26
+        macd_signal: Сигнальная линия MACD (EMA9 от MACD)
+        rsi_gain: Средний рост RSI
+        rsi_loss: Среднее падение RSI
+        atr: ATR
+        adx_tr: Сумма Уайлдера TR для ADX
+        adx_pos: Сумма Уайлдера +DM
+        adx_neg: Сумма Уайлдера -DM
+        adx: ADX
+    """
+    timestamp: Optional[pd.Timestamp]
+    closes: np.ndarray
+    highs: np.ndarray
+    lows: np.ndarray
+    volumes: np.ndarray
+    stoch_k: np.ndarray
+    ema_12: float
+    ema_26: float
+    macd_signal: float
+    rsi_gain: float
+    rsi_loss: float
+    atr: float
+    adx_tr: float
+    adx_pos: float
+    adx_neg: float
+    adx: float
+
 
 class TechnicalAnalyzer:
     """
@@ -19,6 +469,9 @@ class TechnicalAnalyzer:
     Добавляет более 30 технических индикаторов и оценивает силу сигналов.
     """
     
+    # Самый длинный прогрев - SMA100: первые 99 строк содержат NaN
+    WARMUP_BARS = 99
+    
     def add_all_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """
         Добавляет все технические индикаторы к DataFrame.
@@ -33,110 +486,280 @@ class TechnicalAnalyzer:
             df: DataFrame с колонками open, high, low, close, volume
             
         Returns:
-            DataFrame с добавленными индикаторами
+            DataFrame с добавленными индикаторами, без первых WARMUP_BARS строк
         """
-        df = df.copy()
+        # Короче прогрева - ни одной полной строки индикаторов (а окна Bottleneck
+        # длиннее ряда недопустимы): сразу пустой результат с колонками индикаторов
+        if len(df) <= self.WARMUP_BARS:
+            return df.iloc[:0].reindex(columns=[*df.columns, *_INDICATOR_COLUMNS]).astype(np.float32)
+        
+        # Входной DataFrame не изменяется: индикаторы пишутся в одну заранее выделенную
+        # матрицу (N, K) и присоединяются одним concat, без вставки колонок по одной.
+        # Матрица хранится по колонкам - как блок pandas, поэтому оборачивается без копии.
+        # Хранение во float32 (как и OHLCV): для сравнений с порогами и признаков ML
+        # точности хватает, а объем вдвое меньше. Расчет ведется во float64 - рекурсии
+        # EMA/Wilder накапливают ошибку округления, округляется только результат
+        ind = np.empty((len(_INDICATOR_COLUMNS), len(df)), dtype=np.float32).T
+        
+        # Сырые ndarray извлекаются один раз; скользящие окна считаются в C (Bottleneck)
+        high = df['high'].to_numpy(dtype=np.float64)
+        low = df['low'].to_numpy(dtype=np.float64)
+        close = df['close'].to_numpy(dtype=np.float64)
+        volume = df['volume'].to_numpy(dtype=np.float64)
         
         # === ИНДИКАТОРЫ ТРЕНДА ===
         
-        # Скользящие средние
-        df['sma_10'] = ta.trend.sma_indicator(df['close'], window=10)
-        df['sma_20'] = ta.trend.sma_indicator(df['close'], window=20)
-        df['sma_50'] = ta.trend.sma_indicator(df['close'], window=50)
-        df['sma_100'] = ta.trend.sma_indicator(df['close'], window=100)
-        df['ema_12'] = ta.trend.ema_indicator(df['close'], window=12)
-        df['ema_26'] = ta.trend.ema_indicator(df['close'], window=26)
-        
-        # MACD (Moving Average Convergence Divergence)
-        macd = ta.trend.MACD(df['close'])
-        df['macd'] = macd.macd()
-        df['macd_signal'] = macd.macd_signal()
-        df['macd_histogram'] = macd.macd_diff()
+        # Скользящие средние: все периоды за один проход по close
+        sma_10, sma_20, sma_50, sma_100 = _multi_sma(close, _SMA_WINDOWS)
+        ind[:, _COL['sma_10']] = sma_10
+        ind[:, _COL['sma_20']] = sma_20
+        ind[:, _COL['sma_50']] = sma_50
+        ind[:, _COL['sma_100']] = sma_100
+        ema_12 = _ema(close, 12)
+        ema_26 = _ema(close, 26)
+        ind[:, _COL['ema_12']] = ema_12
+        ind[:, _COL['ema_26']] = ema_26
+        
+        # MACD (Moving Average Convergence Divergence) - из тех же EMA12/EMA26,
+        # сигнальная линия - EMA9 от MACD
+        macd = ema_12 - ema_26
+        macd_signal = _ema(macd, 9)
+        ind[:, _COL['macd']] = macd
+        ind[:, _COL['macd_signal']] = macd_signal
+        ind[:, _COL['macd_histogram']] = macd - macd_signal
         
         # ADX (Average Directional Index) - сила тренда
-        adx = ta.trend.ADXIndicator(df['high'], df['low'], df['close'])
-        df['adx'] = adx.adx()
-        df['adx_pos'] = adx.adx_pos()  # +DI
-        df['adx_neg'] = adx.adx_neg()  # -DI
+        adx, adx_pos, adx_neg, _ = _adx(high, low, close, 14)
+        ind[:, _COL['adx']] = adx
+        ind[:, _COL['adx_pos']] = adx_pos  # +DI
+        ind[:, _COL['adx_neg']] = adx_neg  # -DI
         
         # Ichimoku Cloud
         ichimoku = ta.trend.IchimokuIndicator(df['high'], df['low'])
-        df['ichimoku_a'] = ichimoku.ichimoku_a()
-        df['ichimoku_b'] = ichimoku.ichimoku_b()
-        df['ichimoku_base'] = ichimoku.ichimoku_base_line()
-        df['ichimoku_conv'] = ichimoku.ichimoku_conversion_line()
+        ind[:, _COL['ichimoku_a']] = ichimoku.ichimoku_a()
+        ind[:, _COL['ichimoku_b']] = ichimoku.ichimoku_b()
+        ind[:, _COL['ichimoku_base']] = ichimoku.ichimoku_base_line()
+        ind[:, _COL['ichimoku_conv']] = ichimoku.ichimoku_conversion_line()
         
         # === ИНДИКАТОРЫ МОМЕНТУМА ===
         
         # RSI (Relative Strength Index)
-        df['rsi'] = ta.momentum.rsi(df['close'], window=14)
-        df['rsi_6'] = ta.momentum.rsi(df['close'], window=6)  # Быстрый RSI
-        
-        # Stochastic Oscillator
-        stoch = ta.momentum.StochasticOscillator(df['high'], df['low'], df['close'])
-        df['stoch_k'] = stoch.stoch()
-        df['stoch_d'] = stoch.stoch_signal()
+        ind[:, _COL['rsi']] = _rsi(close, 14)
+        ind[:, _COL['rsi_6']] = _rsi(close, 6)  # Быстрый RSI
         
-        # Williams %R
-        df['williams_r'] = ta.momentum.williams_r(df['high'], df['low'], df['close'])
+        # Stochastic Oscillator и Williams %R - из одних максимума/минимума за 14 свечей
+        stoch_k, stoch_d, williams_r = _stochastic(high, low, close)
+        ind[:, _COL['stoch_k']] = stoch_k
+        ind[:, _COL['stoch_d']] = stoch_d
+        ind[:, _COL['williams_r']] = williams_r
         
         # ROC (Rate of Change)
-        df['roc'] = ta.momentum.roc(df['close'], window=10)
+        ind[:, _COL['roc']] = ta.momentum.roc(df['close'], window=10)
         
         # === ИНДИКАТОРЫ ВОЛАТИЛЬНОСТИ ===
         
         # Bollinger Bands
-        bb = ta.volatility.BollingerBands(df['close'])
-        df['bb_upper'] = bb.bollinger_hband()
-        df['bb_middle'] = bb.bollinger_mavg()
-        df['bb_lower'] = bb.bollinger_lband()
-        df['bb_width'] = bb.bollinger_wband()  # Ширина канала
-        df['bb_pband'] = bb.bollinger_pband()  # Позиция цены в канале (0-1)
+        # Средняя линия - та же SMA20, стандартное отклонение считается один раз
+        bb_upper, bb_lower, bb_width, bb_pband = _bbands(close, sma_20)
+        ind[:, _COL['bb_upper']] = bb_upper
+        ind[:, _COL['bb_middle']] = sma_20
+        ind[:, _COL['bb_lower']] = bb_lower
+        ind[:, _COL['bb_width']] = bb_width  # Ширина канала
+        ind[:, _COL['bb_pband']] = bb_pband  # Позиция цены в канале (0-1)
         
         # ATR (Average True Range)
-        df['atr'] = ta.volatility.average_true_range(df['high'], df['low'], df['close'])
-        df['atr_percent'] = (df['atr'] / df['close']) * 100  # ATR в процентах от цены
+        atr = _atr(high, low, close, 14)
+        ind[:, _COL['atr']] = atr
+        ind[:, _COL['atr_percent']] = atr / close * 100  # ATR в процентах от цены
         
         # Keltner Channel
-        kc = ta.volatility.KeltnerChannel(df['high'], df['low'], df['close'])
-        df['kc_upper'] = kc.keltner_channel_hband()
-        df['kc_middle'] = kc.keltner_channel_mband()
-        df['kc_lower'] = kc.keltner_channel_lband()
+        kc_upper, kc_middle, kc_lower = _keltner(high, low, close)
+        ind[:, _COL['kc_upper']] = kc_upper
+        ind[:, _COL['kc_middle']] = kc_middle
+        ind[:, _COL['kc_lower']] = kc_lower
         
         # Donchian Channel
-        dc = ta.volatility.DonchianChannel(df['high'], df['low'], df['close'])
-        df['dc_upper'] = dc.donchian_channel_hband()
-        df['dc_lower'] = dc.donchian_channel_lband()
+        dc_upper, dc_lower = _donchian(high, low)
+        ind[:, _COL['dc_upper']] = dc_upper
+        ind[:, _COL['dc_lower']] = dc_lower
         
         # === ИНДИКАТОРЫ ОБЪЕМА ===
         
         # OBV (On-Balance Volume)
-        df['obv'] = ta.volume.on_balance_volume(df['close'], df['volume'])
+        ind[:, _COL['obv']] = ta.volume.on_balance_volume(df['close'], df['volume'])
         
         # Volume SMA и соотношение
-        df['volume_sma_20'] = ta.trend.sma_indicator(df['volume'], window=20)
-        df['volume_ratio'] = df['volume'] / df['volume_sma_20']
+        volume_sma_20 = bn.move_mean(volume, 20, min_count=20)
+        ind[:, _COL['volume_sma_20']] = volume_sma_20
+        ind[:, _COL['volume_ratio']] = volume / volume_sma_20
         
         # Chaikin Money Flow
-        df['cmf'] = ta.volume.chaikin_money_flow(
+        ind[:, _COL['cmf']] = ta.volume.chaikin_money_flow(
             df['high'], df['low'], df['close'], df['volume']
         )
         
         # === ДОПОЛНИТЕЛЬНЫЕ ИНДИКАТОРЫ ===
         
         # Parabolic SAR
-        psar = ta.trend.PSARIndicator(df['high'], df['low'], df['close'])
-        df['psar'] = psar.psar()
+        ind[:, _COL['psar']] = _psar(high, low, close)
         
         # Vortex Indicator
-        vortex = ta.trend.VortexIndicator(df['high'], df['low'], df['close'])
-        df['vortex_pos'] = vortex.vortex_indicator_pos()
-        df['vortex_neg'] = vortex.vortex_indicator_neg()
+        vortex_pos, vortex_neg = _vortex(high, low, close)
+        ind[:, _COL['vortex_pos']] = vortex_pos
+        ind[:, _COL['vortex_neg']] = vortex_neg
         
-        # Удаляем строки с NaN (начальные периоды без достаточных данных)
-        df.dropna(inplace=True)
+        indicators = pd.DataFrame(ind, columns=_INDICATOR_COLUMNS, index=df.index, copy=False)
+        df = pd.concat([df, indicators], axis=1)
         
-        return df
+        # Отбрасываем начальные строки прогрева индикаторов: NaN в них определяются
+        # длиной окон, поэтому достаточно среза вместо поиска NaN по всей матрице
+        return df.iloc[self.WARMUP_BARS:]
+    
+    def init_state(self, df: pd.DataFrame) -> Optional[IndicatorState]:
+        """
+        Строит состояние онлайн-индикаторов по всем свечам, кроме последней:
+        последняя (незакрытая) свеча еще изменится и передается в update без фиксации.
+        
+        Args:
+            df: DataFrame с колонками open, high, low, close, volume
+            
+        Returns:
+            IndicatorState или None, если истории не хватает на прогрев
+        """
+        if len(df) <= self.WARMUP_BARS + 1:
+            return None
+        
+        committed = df.iloc[:-1]
+        high = committed['high'].to_numpy(dtype=np.float64)
+        low = committed['low'].to_numpy(dtype=np.float64)
+        close = committed['close'].to_numpy(dtype=np.float64)
+        volume = committed['volume'].to_numpy(dtype=np.float64)
+        
+        # Рекурсивные индикаторы - теми же ядрами, что и add_all_indicators
+        ema_12 = _ema(close, 12)
+        ema_26 = _ema(close, 26)
+        macd_signal = _ema(ema_12 - ema_26, 9)
+        _, rsi_gain, rsi_loss = _rsi_state(close, 14)
+        adx, _, _, adx_sums = _adx(high, low, close, 14)
+        stoch_k = _stochastic(high[-16:], low[-16:], close[-16:])[0]
+        
+        return IndicatorState(
+            timestamp=committed.index[-1],
+            closes=close[-50:].copy(),
+            highs=high[-14:].copy(),
+            lows=low[-14:].copy(),
+            volumes=volume[-20:].copy(),
+            stoch_k=stoch_k[-2:].copy(),
+            ema_12=float(ema_12[-1]),
+            ema_26=float(ema_26[-1]),
+            macd_signal=float(macd_signal[-1]),
+            rsi_gain=rsi_gain,
+            rsi_loss=rsi_loss,
+            atr=float(_atr(high, low, close, 14)[-1]),
+            adx_tr=float(adx_sums[0]),
+            adx_pos=float(adx_sums[1]),
+            adx_neg=float(adx_sums[2]),
+            adx=float(adx[-1]),
+        )
+    
+    def update(self, state: IndicatorState, bar: np.ndarray,
+               timestamp: Optional[pd.Timestamp] = None) -> Dict[str, float]:
+        """
+        Рассчитывает индикаторы новой свечи по состоянию после предыдущей.
+        
+        Считаются только колонки, используемые при оценке сигнала (OHLCV, SMA20/50,
+        EMA, MACD, ADX, RSI, Stochastic, Bollinger Bands, ATR, объем) - за время
+        порядка длины окна, без пересчета истории. Значения совпадают с последней
+        строкой add_all_indicators с точностью до округления (float32).
+        
+        Args:
+            state: Состояние после предыдущей закрытой свечи
+            bar: OHLCV свечи (open, high, low, close, volume)
+            timestamp: Время свечи; если передано, свеча считается закрытой и фиксируется
+                в state, иначе состояние не меняется (незакрытая свеча)
+                
+        Returns:
+            Словарь {колонка: значение} для свечи
+        """
+        open_, high, low, close, volume = (float(x) for x in bar)
+        prev_close = state.closes[-1]
+        prev_high = state.highs[-1]
+        prev_low = state.lows[-1]
+        
+        closes = np.append(state.closes[1:], close)
+        highs = np.append(state.highs[1:], high)
+        lows = np.append(state.lows[1:], low)
+        volumes = np.append(state.volumes[1:], volume)
+        
+        # Скользящие средние и Bollinger Bands (средняя линия - SMA20)
+        window = closes[-20:]
+        sma_20 = window.mean()
+        sd = window.std()
+        bb_upper = sma_20 + 2.0 * sd
+        bb_lower = sma_20 - 2.0 * sd
+        band = bb_upper - bb_lower
+        bb_pband = (close - bb_lower) / band if band != 0 else np.nan
+        
+        # EMA и MACD - те же рекурсии, что в _ema
+        alpha = 2.0 / 13.0
+        ema_12 = alpha * close + (1.0 - alpha) * state.ema_12
+        alpha = 2.0 / 27.0
+        ema_26 = alpha * close + (1.0 - alpha) * state.ema_26
+        macd = ema_12 - ema_26
+        alpha = 2.0 / 10.0
+        macd_signal = alpha * macd + (1.0 - alpha) * state.macd_signal
+        
+        # RSI (_rsi_state)
+        delta = close - prev_close
+        alpha = 1.0 / 14.0
+        rsi_gain = alpha * (delta if delta > 0 else 0.0) + (1.0 - alpha) * state.rsi_gain
+        rsi_loss = alpha * (-delta if delta < 0 else 0.0) + (1.0 - alpha) * state.rsi_loss
+        rsi = 100.0 if rsi_loss == 0 else 100.0 - 100.0 / (1.0 + rsi_gain / rsi_loss)
+        
+        # Stochastic: %D - среднее трех последних %K
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stoch_k = 100 * (close - lows.min()) / (highs.max() - lows.min())
+            volume_sma_20 = volumes.mean()
+            volume_ratio = volume / volume_sma_20
+        stoch_d = np.append(state.stoch_k, stoch_k).mean()
+        
+        # ATR (_atr)
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        atr = (state.atr * 13 + tr) / 14
+        
+        # ADX (_adx)
+        tr = max(high, prev_close) - min(low, prev_close)
+        up = high - prev_high
+        down = prev_low - low
+        adx_tr = state.adx_tr - state.adx_tr / 14 + tr
+        adx_pos = state.adx_pos - state.adx_pos / 14 + (up if up > down and up > 0 else 0.0)
+        adx_neg = state.adx_neg - state.adx_neg / 14 + (down if down > up and down > 0 else 0.0)
+        di_pos = 100.0 * adx_pos / adx_tr if adx_tr != 0 else 0.0
+        di_neg = 100.0 * adx_neg / adx_tr if adx_tr != 0 else 0.0
+        dx = 100.0 * abs(di_pos - di_neg) / (di_pos + di_neg) if di_pos + di_neg != 0 else 0.0
+        adx = (state.adx * 13 + dx) / 14
+        
+        if timestamp is not None:
+            state.timestamp = timestamp
+            state.closes, state.highs, state.lows, state.volumes = closes, highs, lows, volumes
+            state.stoch_k = np.append(state.stoch_k[1:], stoch_k)
+            state.ema_12, state.ema_26, state.macd_signal = ema_12, ema_26, macd_signal
+            state.rsi_gain, state.rsi_loss = rsi_gain, rsi_loss
+            state.atr = atr
+            state.adx_tr, state.adx_pos, state.adx_neg, state.adx = adx_tr, adx_pos, adx_neg, adx
+        
+        row = {
+            'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+            'sma_20': sma_20, 'sma_50': closes.mean(),
+            'ema_12': ema_12, 'ema_26': ema_26,
+            'macd': macd, 'macd_signal': macd_signal, 'macd_histogram': macd - macd_signal,
+            'adx': adx, 'rsi': rsi, 'stoch_k': stoch_k, 'stoch_d': stoch_d,
+            'bb_upper': bb_upper, 'bb_middle': sma_20, 'bb_lower': bb_lower, 'bb_pband': bb_pband,
+            'atr': atr, 'atr_percent': atr / close * 100,
+            'volume_sma_20': volume_sma_20, 'volume_ratio': volume_ratio,
+        }
+        # Округление до float32 - как при хранении в add_all_indicators
+        return {col: float(np.float32(value)) for col, value in row.items()}
     
     def get_support_resistance(self, df: pd.DataFrame) -> Dict:
         """
@@ -180,63 +803,75 @@ class TechnicalAnalyzer:
         Returns:
             Словарь с очками бычьих/медвежьих сигналов и уверенностью
         """
-        last = df.iloc[-1]
-        prev = df.iloc[-2]
-        
-        bullish_signals = 0
-        bearish_signals = 0
-        
-        # === RSI АНАЛИЗ ===
-        if last['rsi'] < 30:
-            # Перепроданность - сильный бычий сигнал
-            bullish_signals += 2
-        elif last['rsi'] > 70:
-            # Перекупленность - сильный медвежий сигнал
-            bearish_signals += 2
-        elif last['rsi'] < 45:
-            bullish_signals += 1
-        elif last['rsi'] > 55:
-            bearish_signals += 1
-        
-        # === MACD АНАЛИЗ ===
-        # Пересечение MACD с сигнальной линией
-        if last['macd'] > last['macd_signal'] and prev['macd'] <= prev['macd_signal']:
-            bullish_signals += 2  # Бычье пересечение
-        elif last['macd'] < last['macd_signal'] and prev['macd'] >= prev['macd_signal']:
-            bearish_signals += 2  # Медвежье пересечение
-        elif last['macd'] > last['macd_signal']:
-            bullish_signals += 1
-        else:
-            bearish_signals += 1
-        
-        # === СКОЛЬЗЯЩИЕ СРЕДНИЕ ===
-        if last['close'] > last['sma_20'] > last['sma_50']:
-            bullish_signals += 2  # Бычий тренд
-        elif last['close'] < last['sma_20'] < last['sma_50']:
-            bearish_signals += 2  # Медвежий тренд
-        
-        # === BOLLINGER BANDS ===
-        if last['close'] < last['bb_lower']:
-            bullish_signals += 2  # Цена ниже нижней границы - перепроданность
-        elif last['close'] > last['bb_upper']:
-            bearish_signals += 2  # Цена выше верхней границы - перекупленность
-        
-        # === STOCHASTIC ===
-        if last['stoch_k'] < 20 and last['stoch_k'] > last['stoch_d']:
-            bullish_signals += 1  # Разворот из зоны перепроданности
-        elif last['stoch_k'] > 80 and last['stoch_k'] < last['stoch_d']:
-            bearish_signals += 1  # Разворот из зоны перекупленности
+        # Две последние строки нужных колонок одним ndarray - без построения Series на строку
+        return self._score(df.iloc[-2:][_SIG_COLS].to_numpy())
+    
+    def get_signal_strength_online(self, state: 'IndicatorState', row: Dict[str, float]) -> Dict:
+        """
+        Сила сигнала для строки незакрытой свечи, рассчитанной update без фиксации.
         
-        # === ADX (СИЛА ТРЕНДА) ===
-        trend_strength = last['adx'] if not np.isnan(last['adx']) else 20
+        Args:
+            state: Состояние индикаторов (предыдущая свеча - последняя зафиксированная)
+            row: Результат update(state, bar)
+            
+        Returns:
+            Словарь как у get_signal_strength
+        """
+        # Из предыдущей строки оценка использует только MACD и сигнальную линию
+        prev = np.full(len(_SIG_COLS), np.nan, dtype=np.float32)
+        prev[_SIG_COLS.index('macd')] = state.ema_12 - state.ema_26
+        prev[_SIG_COLS.index('macd_signal')] = state.macd_signal
+        last = np.array([row[col] for col in _SIG_COLS], dtype=np.float32)
+        return self._score(np.vstack([prev, last]))
+    
+    def _score(self, view: np.ndarray) -> Dict:
+        """
+        Подсчет очков по двум последним строкам колонок _SIG_COLS.
         
-        # === ПОДТВЕРЖДЕНИЕ ОБЪЕМОМ ===
-        if last['volume_ratio'] > 1.5:
-            # Повышенный объем подтверждает движение
-            if last['close'] > last['open']:
-                bullish_signals += 1
-            else:
-                bearish_signals += 1
+        Args:
+            view: Массив (2, len(_SIG_COLS)): предыдущая и последняя свеча
+        """
+        (rsi, macd, macd_signal, sma_20, sma_50, close, open_,
+         bb_lower, bb_upper, stoch_k, stoch_d, adx, volume_ratio) = view[-1]
+        prev_macd, prev_macd_signal = view[0, 1], view[0, 2]
+        
+        # Каскады if/elif заменены взаимоисключающими условиями: каждое условие - элемент
+        # маски, очки - скалярное произведение маски на веса. Сравнения с NaN дают False,
+        # как и в ветвлениях; "иначе" в MACD - отрицание остальных веток
+        macd_up = macd > macd_signal
+        macd_down = macd < macd_signal
+        cross_up = macd_up & (prev_macd <= prev_macd_signal)
+        cross_down = macd_down & (prev_macd >= prev_macd_signal)
+        below_bb = close < bb_lower
+        high_volume = volume_ratio > 1.5
+        green = close > open_
+        
+        bull = np.array([
+            rsi < 30,                            # RSI: перепроданность
+            (rsi >= 30) & (rsi < 45),            # RSI: слабый бычий
+            cross_up,                            # MACD: бычье пересечение
+            macd_up & ~cross_up,                 # MACD выше сигнальной
+            close > sma_20 > sma_50,             # MA: бычий тренд
+            below_bb,                            # BB: ниже нижней границы
+            (stoch_k < 20) & (stoch_k > stoch_d),  # Stochastic: разворот из перепроданности
+            high_volume & green,                 # Объем подтверждает рост
+        ], dtype=np.int8)
+        bear = np.array([
+            rsi > 70,                            # RSI: перекупленность
+            (rsi > 55) & (rsi <= 70),            # RSI: слабый медвежий
+            cross_down & ~cross_up,              # MACD: медвежье пересечение
+            ~macd_up & ~cross_down,              # MACD не выше сигнальной
+            close < sma_20 < sma_50,             # MA: медвежий тренд
+            ~below_bb & (close > bb_upper),      # BB: выше верхней границы
+            (stoch_k > 80) & (stoch_k < stoch_d),  # Stochastic: разворот из перекупленности
+            high_volume & ~green,                # Объем подтверждает падение
+        ], dtype=np.int8)
+        
+        bullish_signals = int(bull @ _SIGNAL_WEIGHTS)
+        bearish_signals = int(bear @ _SIGNAL_WEIGHTS)
+        
+        # === ADX (СИЛА ТРЕНДА) ===
+        trend_strength = adx if not np.isnan(adx) else 20
         
         total_signals = bullish_signals + bearish_signals
         
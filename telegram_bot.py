@@ -3,8 +3,21 @@
 Управляет отправкой сообщений и уведомлений
 """
 
-from telegram import Bot
+from typing import Dict, Iterable, List
+import asyncio
 import logging
+import httpx
+
+from config import (
+    TELEGRAM_MAX_CONCURRENT_SENDS, TELEGRAM_MAX_RETRIES,
+    TELEGRAM_KEEPALIVE_CONNECTIONS, TELEGRAM_REQUEST_TIMEOUT
+)
+
+try:
+    # HTTP/2 мультиплексирует пачку отправок в одном соединении. Без h2 - HTTP/1.1 с keep-alive
+    import h2
+except ImportError:
+    h2 = None
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +25,8 @@ logger = logging.getLogger(__name__)
 class TelegramBot:
     """
     Класс для отправки сообщений в Telegram.
-    Использует python-telegram-bot для взаимодействия с Telegram API.
+    Отправляет запросы в Bot API через постоянный httpx.AsyncClient:
+    соединение (и TLS-сессия) переиспользуется между сообщениями.
     """
     
     def __init__(self, token: str, chat_id: str):
@@ -23,38 +37,129 @@ class TelegramBot:
             token: Токен Telegram бота от @BotFather
             chat_id: ID чата/канала для отправки сообщений
         """
-        self.bot = Bot(token)
         self.chat_id = chat_id
+        self._client = httpx.AsyncClient(
+            base_url=f"https://api.telegram.org/bot{token}/",
+            http2=h2 is not None,
+            timeout=TELEGRAM_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=TELEGRAM_KEEPALIVE_CONNECTIONS),
+        )
+        # Ограничение одновременных запросов к API при пакетной отправке
+        self._send_limit = asyncio.Semaphore(TELEGRAM_MAX_CONCURRENT_SENDS)
     
-    async def send(self, text: str, parse_mode: str = 'Markdown'):
+    async def send(self, text: str, parse_mode: str = 'Markdown') -> bool:
         """
         Отправляет текстовое сообщение в чат.
+        При превышении лимита (429) ждет retry_after и повторяет до TELEGRAM_MAX_RETRIES раз.
         
         Args:
             text: Текст сообщения
             parse_mode: Режим парсинга (Markdown или HTML)
+            
+        Returns:
+            True, если сообщение доставлено
         """
         try:
-            await self.bot.send_message(
-                chat_id=self.chat_id,
-                text=text,
-                parse_mode=parse_mode
-            )
-            logger.debug(f"Сообщение отправлено в чат {self.chat_id}")
+            async with self._send_limit:
+                for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+                    response = await self._client.post("sendMessage", json={
+                        'chat_id': self.chat_id,
+                        'text': text,
+                        'parse_mode': parse_mode,
+                    })
+                    result = response.json()
+                    if result.get('ok'):
+                        logger.debug(f"Сообщение отправлено в чат {self.chat_id}")
+                        return True
+                    
+                    retry_after = result.get('parameters', {}).get('retry_after')
+                    if response.status_code != 429 or retry_after is None or attempt == TELEGRAM_MAX_RETRIES:
+                        break
+                    # Ожидание под семафором: лимит общий для чата, остальные отправки тоже ждут
+                    logger.warning(f"Лимит Telegram, повтор через {retry_after} с")
+                    await asyncio.sleep(retry_after)
+            
+            logger.error(f"Ошибка отправки сообщения в Telegram: {result.get('description')}")
         except Exception as e:
             logger.error(f"Ошибка отправки сообщения в Telegram: {e}")
+        return False
+    
+    async def close(self):
+        """Закрывает HTTP-клиент Bot API"""
+        await self._client.aclose()
+    
+    async def send_many(self, messages: List[str], parse_mode: str = 'Markdown') -> List[bool]:
+        """
+        Отправляет пачку сообщений конкурентно (в пределах TELEGRAM_MAX_CONCURRENT_SENDS).
+        Порядок доставки не гарантируется.
+        
+        Args:
+            messages: Тексты сообщений
+            parse_mode: Режим парсинга (Markdown или HTML)
+            
+        Returns:
+            Флаги доставки в порядке messages
+        """
+        results = await asyncio.gather(
+            *(self.send(text, parse_mode) for text in messages), return_exceptions=True
+        )
+        return [result is True for result in results]
+    
+    async def send_signal_results(self, results: Iterable[dict]) -> int:
+        """
+        Отправляет уведомления о результатах сигналов.
+        События одной монеты (TP1, TP2, SL) уходят последовательно и приходят по порядку,
+        разные монеты отправляются конкурентно.
+        
+        Args:
+            results: Словари результатов (см. format_signal_result)
+            
+        Returns:
+            Количество доставленных уведомлений
+        """
+        by_symbol: Dict[str, List[str]] = {}
+        for result in results:
+            by_symbol.setdefault(result['signal'].symbol, []).append(self.format_signal_result(result))
+        
+        delivered = await asyncio.gather(
+            *(self._send_sequence(messages) for messages in by_symbol.values())
+        )
+        return sum(delivered)
+    
+    async def _send_sequence(self, messages: List[str]) -> int:
+        """Отправляет сообщения строго по очереди; возвращает количество доставленных"""
+        delivered = 0
+        for text in messages:
+            delivered += await self.send(text)
+        return delivered
     
-    async def send_signal_result(self, result: dict):
+    async def send_signal_result(self, result: dict) -> bool:
         """
         Отправляет уведомление о результате сигнала (достижение TP или SL).
         
+        Args:
+            result: Словарь с данными результата (см. format_signal_result)
+            
+        Returns:
+            True, если уведомление доставлено
+        """
+        return await self.send(self.format_signal_result(result))
+    
+    @staticmethod
+    def format_signal_result(result: dict) -> str:
+        """
+        Формирует уведомление о результате сигнала (достижение TP или SL).
+        
         Args:
             result: Словарь с данными результата
                 - type: тип события (TP1, TP2, TP3_FULL, STOP_LOSS)
-                - signal: данные сигнала
+                - signal: данные сигнала (database.SigRow)
                 - pnl: процент прибыли/убытка
+                
+        Returns:
+            Текст сообщения
         """
-        symbol = result['signal']['symbol']
+        symbol = result['signal'].symbol
         pnl = result['pnl']
         result_type = result['type']
         
@@ -72,6 +177,4 @@ class TelegramBot:
         # Форматируем PnL
         pnl_str = f"+{pnl:.2f}%" if pnl > 0 else f"{pnl:.2f}%"
         
-        message = f"{emoji} #{symbol} - {text}: {pnl_str}"
-        
-        await self.send(message)
+        return f"{emoji} #{symbol} - {text}: {pnl_str}"
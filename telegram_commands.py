@@ -11,6 +11,44 @@ import database as db
 logger = logging.getLogger(__name__)
 
 
+# Шаблон блока сделки для /active: разбирается один раз при импорте модуля
+_TRADE_TMPL = (
+    "{emoji} *#{symbol}* ({side})\n"
+    "├ Вход A: {ea:.4f}\n"
+    "├ Вход B: {eb}\n"
+    "├ SL: {sl:.4f}\n"
+    "├ TP1 {s1}: {tp1:.4f}\n"
+    "├ TP2 {s2}: {tp2:.4f}\n"
+    "└ TP3: {tp3:.4f}"
+)
+
+
+def _format_trade(trade) -> str:
+    """
+    Блок одной активной сделки для сообщения /active.
+    
+    Args:
+        trade: Открытая сделка (database.ActiveRow)
+        
+    Returns:
+        Многострочный текст в Markdown
+    """
+    return _TRADE_TMPL.format(
+        emoji="🐂" if trade.side == 'LONG' else "🐻",
+        symbol=trade.symbol,
+        side=trade.side,
+        ea=trade.entry_a,
+        # Точки усреднения может не быть (ENABLE_AVERAGING = False)
+        eb=f"{trade.entry_b:.4f}" if trade.entry_b else 'N/A',
+        sl=trade.stop,
+        s1="✅" if trade.tp1_hit else "⏳",
+        tp1=trade.tp1,
+        s2="✅" if trade.tp2_hit else "⏳",
+        tp2=trade.tp2,
+        tp3=trade.tp3,
+    )
+
+
 def setup(engine, token: str) -> Application:
     """
     Настраивает Telegram Application с обработчиками команд.
@@ -66,30 +104,17 @@ def setup(engine, token: str) -> Application:
     async def active(update, context):
         """Обработчик команды /active - показать активные сигналы"""
         try:
-            open_trades = db.get_open_trades()
+            open_trades = db.get_active_trades()
             
             if not open_trades:
                 await update.message.reply_text("📭 Нет активных сигналов")
                 return
             
-            message = f"📋 *Активные сигналы ({len(open_trades)}):*\n\n"
-            
-            for trade in open_trades:
-                side_emoji = "🐂" if trade['side'] == 'LONG' else "🐻"
-                tp1_status = "✅" if trade['tp1_hit'] else "⏳"
-                tp2_status = "✅" if trade['tp2_hit'] else "⏳"
-                
-                message += f"""
-{side_emoji} *#{trade['symbol']}* ({trade['side']})
-├ Вход A: {trade['entry_a']:.4f}
-├ Вход B: {trade['entry_b']:.4f if trade['entry_b'] else 'N/A'}
-├ SL: {trade['stop']:.4f}
-├ TP1 {tp1_status}: {trade['tp1']:.4f}
-├ TP2 {tp2_status}: {trade['tp2']:.4f}
-└ TP3: {trade['tp3']:.4f}
-"""
+            # Части собираются в список и склеиваются один раз, без += в цикле
+            parts = [f"📋 *Активные сигналы ({len(open_trades)}):*\n"]
+            parts.extend(_format_trade(trade) for trade in open_trades)
             
-            await update.message.reply_text(message.strip(), parse_mode='Markdown')
+            await update.message.reply_text('\n\n'.join(parts), parse_mode='Markdown')
             
         except Exception as e:
             logger.error(f"Ошибка получения активных сигналов: {e}")